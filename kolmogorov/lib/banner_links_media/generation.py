@@ -1,18 +1,83 @@
 import json
 import os
-from typing import Any
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Final
 
 import pandas as pd
 import requests
-from requests.exceptions import HTTPError
+from requests.adapters import HTTPAdapter
+from requests.exceptions import HTTPError, RequestException
 
 from lib.skill_executions.banner_link.link import BannerLink
 from lib.skill_executions.banner_links_media.types import EnumSkillError, ErrorCode, KnownChannels
 from lib.skill_executions.banner_links_media.validation import get_banner_type
 from lib.time import now_time_msk, output_time
 
+SHORT_URL_ENDPOINT: Final = "https://lab.sirius.online/lab-noo/developer/shorten-link"
+SHORT_URL_TIMEOUT: Final = 10
+SHORT_URL_MAX_WORKERS: Final = 16
+SHORT_LINK_CHANNELS: Final = frozenset({KnownChannels.VK, KnownChannels.TG})
 
-def generate_link(line: pd.Series, is_test: bool = False) -> tuple[Any, Any]:  # type: ignore[type-arg]
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+    # Одна keep-alive сессия на процесс, размер пула совпадает с числом потоков
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=SHORT_URL_MAX_WORKERS)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def needs_short_link(line: pd.Series) -> bool:  # type: ignore[type-arg]
+    return KnownChannels(str(line["channel"]).strip()) in SHORT_LINK_CHANNELS
+
+
+def shorten_link(long_link: str, key: str, session: requests.Session | None = None) -> str:
+    r = (session or _get_session()).post(
+        SHORT_URL_ENDPOINT,
+        data=json.dumps({"longLink": long_link}),
+        headers={
+            "accept": "application/json;charset=utf-8",
+            "Authorization": key,
+            "content-type": "application/json;charset=utf-8",
+        },
+        timeout=SHORT_URL_TIMEOUT,
+    )
+    r.raise_for_status()
+    if "newShortLink" in r.json().get("success", {}):
+        return str(r.json()["success"]["newShortLink"])
+    return long_link
+
+
+def shorten_links(long_links: list[str]) -> list[tuple[str | None, EnumSkillError | None]]:
+    """Сокращает ссылки параллельно. Порядок результатов совпадает с порядком входа, ошибки — построчно."""
+    if not long_links:
+        return []
+
+    key = os.getenv("SHORT_URL_SECRET_KEY")
+    if key is None:
+        return [(None, EnumSkillError(ErrorCode.SHORT_URL_KEY_MISSING))] * len(long_links)
+
+    session = _get_session()
+
+    def _shorten(long_link: str) -> tuple[str | None, EnumSkillError | None]:
+        try:
+            return shorten_link(long_link, key, session), None
+        except RequestException as e:
+            return None, EnumSkillError(ErrorCode.SHORT_URL_GENERATION_FAILED, str(e))
+
+    with ThreadPoolExecutor(max_workers=min(SHORT_URL_MAX_WORKERS, len(long_links))) as executor:
+        return list(executor.map(_shorten, long_links))
+
+
+def generate_link(line: pd.Series, is_test: bool = False, shorten: bool = True) -> tuple[Any, Any]:  # type: ignore[type-arg]
     description = (
         f"Канал: {line['channel']}.\n"
         f"Партнёр: {line['partner']}.\n"
@@ -31,25 +96,13 @@ def generate_link(line: pd.Series, is_test: bool = False) -> tuple[Any, Any]:  #
         return None, EnumSkillError(ErrorCode.BANNER_GENERATION, str(e))
 
     # Короткая ссылка
-    if KnownChannels(str(line["channel"]).strip()) in [KnownChannels.VK, KnownChannels.TG] and not is_test:
+    if shorten and needs_short_link(line) and not is_test:
         key = os.getenv("SHORT_URL_SECRET_KEY")
         if key is None:
             return None, EnumSkillError(ErrorCode.SHORT_URL_KEY_MISSING)
 
         try:
-            r = requests.post(
-                "https://lab.sirius.online/lab-noo/developer/shorten-link",
-                data=json.dumps({"longLink": banner_link}),
-                headers={
-                    "accept": "application/json;charset=utf-8",
-                    "Authorization": key,
-                    "content-type": "application/json;charset=utf-8",
-                },
-                timeout=10,
-            )
-            r.raise_for_status()
-            if "newShortLink" in r.json().get("success", {}):
-                banner_link = r.json()["success"]["newShortLink"]
+            banner_link = shorten_link(banner_link, key)
         except HTTPError as e:
             return None, EnumSkillError(ErrorCode.SHORT_URL_GENERATION_FAILED, str(e))
 
@@ -1,6 +1,25 @@
-from typing import Final
+import json
+from collections.abc import Sequence
+from typing import Any, Final
 
 from lib.data_source import AnalyticsDB
+from lib.skill_executions.banner_links_media.types import BannerKey, BannerLinkRecord, JobStatus, RowCheckpoint
+
+INSERT_BATCH_SIZE: Final = 1000
+JOB_CREATE_ATTEMPTS: Final = 3
+
+_INSERT_COLUMNS: Final = (
+    "banner_id",
+    "banner_link",
+    "title",
+    "publication_type",
+    "is_outer",
+    "channel",
+    "link",
+    "is_technical",
+    "partner",
+    "is_deleted",
+)
 
 
 class AnalyticsBannerLinks:
@@ -20,26 +39,366 @@ class AnalyticsBannerLinks:
         partner: str,
         is_deleted: bool,
     ) -> None:
+        self.insert_many(
+            [
+                BannerLinkRecord(
+                    banner_id=banner_id,
+                    banner_link=banner_link,
+                    title=title,
+                    publication_type=publication_type,
+                    is_outer=is_outer,
+                    channel=channel,
+                    link=link,
+                    is_technical=is_technical,
+                    partner=partner,
+                    is_deleted=is_deleted,
+                )
+            ]
+        )
+
+    def insert_many(self, records: Sequence[BannerLinkRecord]) -> None:
+        """Вставляет все записи одной транзакцией: при ошибке в любой строке откатывается весь батч."""
+        if not records:
+            return
+
+        with self._db_session.get_connection() as conn:
+            try:
+                with conn.cursor() as cursor:
+                    for start in range(0, len(records), INSERT_BATCH_SIZE):
+                        batch = records[start : start + INSERT_BATCH_SIZE]
+                        values = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"] * len(batch))
+                        cursor.execute(
+                            f"""
+                            insert into analytics.banner_links_media(
+                                {", ".join(_INSERT_COLUMNS)}
+                            )
+                            values {values}
+                            """,  # noqa: S608
+                            [value for record in batch for value in record.as_row()],
+                        )
+            except Exception:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def find_existing(self, keys: Sequence[BannerKey]) -> dict[BannerKey, tuple[int, str]]:
+        """Последний неудалённый баннер для каждого ключа (link, channel, partner, publication_type).
+
+        Читается по индексу analytics.banner_links_media(link, channel, partner, publication_type).
+        """
+        if not keys:
+            return {}
+
+        links, channels, partners, publication_types = (list(column) for column in zip(*keys))
+        with self._db_session.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    select distinct on (b.link, b.channel, b.partner, b.publication_type)
+                        b.link,
+                        b.channel,
+                        b.partner,
+                        b.publication_type,
+                        b.banner_id,
+                        b.banner_link
+                    from analytics.banner_links_media b
+                        join unnest(%s::text[], %s::text[], %s::text[], %s::text[])
+                            as k(link, channel, partner, publication_type)
+                          on b.link = k.link
+                         and b.channel = k.channel
+                         and b.partner = k.partner
+                         and b.publication_type = k.publication_type
+                    where not b.is_deleted
+                    order by b.link, b.channel, b.partner, b.publication_type, b.banner_id desc
+                    """,
+                    (links, channels, partners, publication_types),
+                )
+                return {tuple(row[:4]): (row[4], row[5]) for row in cursor.fetchall()}  # type: ignore[misc]
+
+
+class BannerLinksMediaCheckpoints:
+    """Построчные чекпоинты генерации по register_id: повтор запроса продолжает с первой незаконченной строки.
+
+    Вместе со строками хранится хэш файла, чтобы продолжить можно было только тот же самый запрос.
+    """
+
+    def __init__(self, db_session: AnalyticsDB) -> None:
+        self._db_session: Final = db_session
+
+    def get_content_hash(self, register_id: int) -> str | None:
+        with self._db_session.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    select content_hash
+                    from analytics.banner_links_media_checkpoints
+                    where register_id = %s
+                    limit 1
+                    """,
+                    (register_id,),
+                )
+                row = cursor.fetchone()
+        return row[0] if row is not None else None
+
+    def get(self, register_id: int, content_hash: str) -> dict[int, RowCheckpoint]:
         with self._db_session.get_connection() as conn:
             with conn.cursor() as cursor:
                 cursor.execute(
                     """
-                    insert into analytics.banner_links_media(
-                        banner_id, banner_link, title, publication_type, is_outer, channel,
-                        link, is_technical, partner, is_deleted
+                    select row_num, link, banner_id, banner_link, short_link
+                    from analytics.banner_links_media_checkpoints
+                    where register_id = %s
+                      and content_hash = %s
+                    """,
+                    (register_id, content_hash),
+                )
+                return {row[0]: RowCheckpoint(*row) for row in cursor.fetchall()}
+
+    def save(self, register_id: int, content_hash: str, checkpoints: Sequence[RowCheckpoint]) -> None:
+        if not checkpoints:
+            return
+
+        with self._db_session.get_connection() as conn:
+            with conn.cursor() as cursor:
+                values = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, now())"] * len(checkpoints))
+                cursor.execute(
+                    f"""
+                    insert into analytics.banner_links_media_checkpoints(
+                        register_id, row_num, content_hash, link, banner_id, banner_link, short_link, time_updated
                     )
-                    values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    values {values}
+                    on conflict (register_id, row_num) do update
+                        set content_hash = excluded.content_hash,
+                            link = excluded.link,
+                            banner_id = excluded.banner_id,
+                            banner_link = excluded.banner_link,
+                            short_link = excluded.short_link,
+                            time_updated = excluded.time_updated
+                    """,  # noqa: S608
+                    [
+                        value
+                        for cp in checkpoints
+                        for value in (
+                            register_id,
+                            cp.row,
+                            content_hash,
+                            cp.link,
+                            cp.banner_id,
+                            cp.banner_link,
+                            cp.short_link,
+                        )
+                    ],
+                )
+            conn.commit()
+
+
+class BannerLinksMediaResults:
+    """Результаты успешных запросов по хэшу содержимого: повтор того же файла не генерирует баннеры заново."""
+
+    def __init__(self, db_session: AnalyticsDB) -> None:
+        self._db_session: Final = db_session
+
+    def get(self, content_hash: str, window_seconds: int) -> list[dict[str, Any]] | None:
+        with self._db_session.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    select result
+                    from analytics.banner_links_media_results
+                    where content_hash = %s
+                      and time_created > now() - make_interval(secs => %s)
+                    """,
+                    (content_hash, window_seconds),
+                )
+                row = cursor.fetchone()
+        return row[0] if row is not None else None
+
+    def save(self, content_hash: str, register_id: int, result: list[dict[str, Any]]) -> None:
+        with self._db_session.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    insert into analytics.banner_links_media_results(content_hash, register_id, result, time_created)
+                    values (%s, %s, %s::jsonb, now())
+                    on conflict (content_hash) do update
+                        set register_id = excluded.register_id,
+                            result = excluded.result,
+                            time_created = excluded.time_created
+                    """,
+                    (content_hash, register_id, json.dumps(result, ensure_ascii=False)),
+                )
+            conn.commit()
+
+
+class BannerLinksMediaJobs:
+    """Задачи генерации баннерных ссылок: прогресс и результат по тикету.
+
+    У каждого файла (content_hash) не больше одной задачи в «running» — это держит частичный
+    уникальный индекс из sql/banner_links_media/001_jobs_content_hash.sql.
+    """
+
+    def __init__(self, db_session: AnalyticsDB) -> None:
+        self._db_session: Final = db_session
+
+    def create(self, ticket: str, register_id: int, rows_total: int, content_hash: str) -> str:
+        """Создаёт задачу и возвращает её тикет.
+
+        Если тот же файл уже обрабатывается, новая задача не создаётся и возвращается тикет выполняющейся.
+        """
+        with self._db_session.get_connection() as conn:
+            with conn.cursor() as cursor:
+                # Выполняющаяся задача может завершиться между insert и select — тогда пробуем ещё раз
+                for _ in range(JOB_CREATE_ATTEMPTS):
+                    cursor.execute(
+                        """
+                        insert into analytics.banner_links_media_jobs(
+                            ticket, register_id, content_hash, status, rows_done, rows_total, time_created, time_updated
+                        )
+                        values (%s, %s, %s, %s, 0, %s, now(), now())
+                        on conflict (content_hash) where status = 'running' do nothing
+                        returning ticket
+                        """,
+                        (ticket, register_id, content_hash, JobStatus.RUNNING.value, rows_total),
+                    )
+                    row = cursor.fetchone()
+                    if row is None:
+                        cursor.execute(
+                            """
+                            select ticket
+                            from analytics.banner_links_media_jobs
+                            where content_hash = %s
+                              and status = %s
+                            """,
+                            (content_hash, JobStatus.RUNNING.value),
+                        )
+                        row = cursor.fetchone()
+                    conn.commit()
+                    if row is not None:
+                        return row[0]  # type: ignore[no-any-return]
+        raise RuntimeError(f"Can't create banner links job for {content_hash}")
+
+    def find_running(self, content_hash: str) -> str | None:
+        """Тикет задачи, которая сейчас обрабатывает тот же файл."""
+        with self._db_session.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    select ticket
+                    from analytics.banner_links_media_jobs
+                    where content_hash = %s
+                      and status = %s
+                    """,
+                    (content_hash, JobStatus.RUNNING.value),
+                )
+                row = cursor.fetchone()
+        return row[0] if row is not None else None
+
+    def update_progress(self, ticket: str, rows_done: int) -> None:
+        with self._db_session.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    update analytics.banner_links_media_jobs
+                    set rows_done = %s,
+                        time_updated = now()
+                    where ticket = %s
+                    """,
+                    (rows_done, ticket),
+                )
+            conn.commit()
+
+    def touch(self, ticket: str) -> None:
+        """Отмечает, что задача жива: статус «running» без отметок дольше порога считается потерянным."""
+        with self._db_session.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    update analytics.banner_links_media_jobs
+                    set time_updated = now()
+                    where ticket = %s
+                      and status = %s
+                    """,
+                    (ticket, JobStatus.RUNNING.value),
+                )
+            conn.commit()
+
+    def fail_stale(self, ticket: str, stale_after_seconds: int, error: dict[str, Any]) -> int | None:
+        """Переводит в «failed» задачу, которая дольше stale_after_seconds в «running» без отметок.
+
+        Возвращает register_id, если задача была переведена.
+        """
+        with self._db_session.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    update analytics.banner_links_media_jobs
+                    set status = %s,
+                        error = %s::jsonb || jsonb_build_object('register_id', register_id),
+                        time_updated = now()
+                    where ticket = %s
+                      and status = %s
+                      and time_updated < now() - make_interval(secs => %s)
+                    returning register_id
+                    """,
+                    (
+                        JobStatus.FAILED.value,
+                        json.dumps(error, ensure_ascii=False),
+                        ticket,
+                        JobStatus.RUNNING.value,
+                        stale_after_seconds,
+                    ),
+                )
+                row = cursor.fetchone()
+            conn.commit()
+        return row[0] if row is not None else None
+
+    def finish(
+        self,
+        ticket: str,
+        job_status: JobStatus,
+        result: list[dict[str, Any]] | None = None,
+        error: dict[str, Any] | None = None,
+    ) -> None:
+        with self._db_session.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    update analytics.banner_links_media_jobs
+                    set status = %s,
+                        result = %s::jsonb,
+                        error = %s::jsonb,
+                        time_updated = now()
+                    where ticket = %s
                     """,
                     (
-                        banner_id,
-                        banner_link,
-                        title,
-                        publication_type,
-                        is_outer,
-                        channel,
-                        link,
-                        is_technical,
-                        partner,
-                        is_deleted,
+                        job_status.value,
+                        json.dumps(result, ensure_ascii=False) if result is not None else None,
+                        json.dumps(error, ensure_ascii=False) if error is not None else None,
+                        ticket,
                     ),
                 )
+            conn.commit()
+
+    def get(self, ticket: str) -> dict[str, Any] | None:
+        with self._db_session.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    select status, rows_done, rows_total, result, error
+                    from analytics.banner_links_media_jobs
+                    where ticket = %s
+                    """,
+                    (ticket,),
+                )
+                row = cursor.fetchone()
+
+        if row is None:
+            return None
+        job_status, rows_done, rows_total, result, error = row
+        return {
+            "status": job_status,
+            "rows_done": rows_done,
+            "rows_total": rows_total,
+            "file": result,
+            **(error or {}),
+        }
@@ -1,3 +1,4 @@
+from dataclasses import dataclass
 from enum import Enum
 from typing import Any
 
@@ -39,22 +40,34 @@ class KnownChannels(Enum):
     YOUTUBE = "Ютуб"
 
 
+class JobStatus(Enum):
+    RUNNING = "running"
+    SUCCEED = "succeed"
+    FAILED = "failed"
+
+
 class EnumSkillError(Exception):
-    def __init__(self, code: "ErrorCode", *args: Any) -> None:
+    def __init__(self, code: "ErrorCode", *args: Any, details: list[dict[str, Any]] | None = None) -> None:
         detail = code.template.format(*args)
         super().__init__(detail)
         self.code = code
         self.args_ = args
+        self.details = details
 
-    def to_response(self) -> JSONResponse:
+    def to_response(self, register_id: int | None = None) -> JSONResponse:
         msg = self.code.template.format(*self.args_)
+        content: dict[str, Any] = {
+            "error_code": self.code.name,
+            "error": self.code.client_error,
+            "error_reason": msg,
+        }
+        if self.details is not None:
+            content["details"] = self.details
+        if register_id is not None:
+            content["register_id"] = register_id
         return JSONResponse(
             status_code=self.code.http_status,
-            content={
-                "error_code": self.code.name,
-                "error": self.code.client_error,
-                "error_reason": msg,
-            },
+            content=content,
         )
 
 
@@ -99,13 +112,71 @@ class ErrorCode(Enum):
         "Failed to generate short URL",
         status.HTTP_500_INTERNAL_SERVER_ERROR,
     )
+    RESUME_MISMATCH = (
+        "Request {0} can't be resumed with a different file",
+        "Can't resume request",
+        status.HTTP_409_CONFLICT,
+    )
+    JOB_INTERRUPTED = (
+        "Job {0} stopped updating and was marked as failed, resend the file with resume_id to continue",
+        "Banner links generation was interrupted",
+        status.HTTP_500_INTERNAL_SERVER_ERROR,
+    )
     DB_UPDATE_FAILED = (
         "Failed to update banner record in DB: {0}",
         "Failed to update banner link",
         status.HTTP_500_INTERNAL_SERVER_ERROR,
     )
+    JOB_START_FAILED = (
+        "Failed to start banner links job: {0}",
+        "Can't start banner links generation",
+        status.HTTP_500_INTERNAL_SERVER_ERROR,
+    )
 
     def __init__(self, template: str, client_error: str, http_status: int):
         self.template = template
         self.client_error = client_error
         self.http_status = http_status
+
+
+# Баннер с тем же (link, channel, partner, publication_type) можно переиспользовать
+BannerKey = tuple[str, str, str, str]
+
+
+@dataclass(frozen=True)
+class BannerLinkRecord:
+    banner_id: int
+    banner_link: str
+    title: str
+    publication_type: str
+    is_outer: bool
+    channel: str
+    link: str
+    is_technical: bool
+    partner: str
+    is_deleted: bool
+
+    def as_row(self) -> tuple[Any, ...]:
+        return (
+            self.banner_id,
+            self.banner_link,
+            self.title,
+            self.publication_type,
+            self.is_outer,
+            self.channel,
+            self.link,
+            self.is_technical,
+            self.partner,
+            self.is_deleted,
+        )
+
+
+@dataclass(frozen=True)
+class RowCheckpoint:
+    """Готовый результат строки запроса: баннер создан, короткая ссылка — если уже получена."""
+
+    row: int
+    link: str
+    banner_id: int
+    banner_link: str
+    short_link: str | None = None
@@ -0,0 +1,60 @@
+import hashlib
+import json
+from typing import IO, Final
+
+import pandas as pd
+
+UPLOAD_CHUNK_ROWS: Final = 500
+
+# Заголовки CSV, который пользователи присылают боту
+UPLOAD_COLUMN_RENAMES: Final = {
+    "Ссылка": "link",
+    "Канал": "channel",
+    "Партнёр": "partner",
+    "Тип публикации": "publication_type",
+    "Название публикации": "description",
+    "Тип партнёра": "partner_type",
+    "Техническая ссылка": "is_technical",
+}
+
+
+GZIP_MAGIC: Final = b"\x1f\x8b"
+GZIP_CONTENT_TYPES: Final = ("application/gzip", "application/x-gzip")
+
+
+def is_gzip_upload(stream: IO[bytes], content_type: str | None) -> bool:
+    """Сжат ли файл gzip: по сигнатуре в начале потока или по типу самой части формы.
+
+    Content-Encoding запроса относится ко всему телу multipart, а не к файлу, поэтому не учитывается.
+    Позиция потока после проверки остаётся прежней.
+    """
+    position = stream.tell()
+    magic = stream.read(len(GZIP_MAGIC))
+    stream.seek(position)
+    return magic == GZIP_MAGIC or content_type in GZIP_CONTENT_TYPES
+
+
+def read_upload(stream: IO[bytes], gzipped: bool = False) -> pd.DataFrame:
+    """Читает CSV из потока частями, не загружая сырое тело запроса в память целиком."""
+    chunks = pd.read_csv(
+        stream,
+        chunksize=UPLOAD_CHUNK_ROWS,
+        compression="gzip" if gzipped else None,
+        dtype=str,
+        encoding="utf-8-sig",
+    )
+    frames = [chunk.rename(columns=UPLOAD_COLUMN_RENAMES).dropna(how="all") for chunk in chunks]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True).fillna("")
+
+
+def records_hash(data: pd.DataFrame) -> str:
+    """Хэш содержимого таблицы: значения приводятся к строкам без пробелов по краям, колонки — по имени.
+
+    Один и тот же файл, присланный повторно (в том числе через другой эндпоинт), даёт тот же хэш.
+    """
+    columns = sorted(data.columns)
+    records = [[str(value).strip() for value in row] for row in data[columns].itertuples(index=False)]
+    payload = json.dumps({"columns": columns, "records": records}, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
@@ -1,3 +1,5 @@
+from typing import Any
+
 import pandas as pd
 
 from lib.skill_executions.banner_link.link import BannerLinkType
@@ -15,6 +17,10 @@ LINK_TYPE_TRANSLATION = {
     "кьюар": BannerLinkType.QR,
 }
 
+LINK_TYPE_VALUES = frozenset(LINK_TYPE_TRANSLATION)
+KNOWN_CHANNEL_VALUES = frozenset(channel.value for channel in KnownChannels)
+KNOWN_PARTNER_VALUES = frozenset(partner.value for partner in KnownPartners)
+
 REQUIRED_COLUMNS = ["link", "channel", "partner", "publication_type", "partner_type"]
 
 
@@ -30,21 +36,40 @@ def validate_columns(data: pd.DataFrame) -> None:
         raise EnumSkillError(ErrorCode.COLUMN_MISMATCH)
 
 
+def find_invalid_values(data: pd.DataFrame) -> list[dict[str, Any]]:
+    """Проверяет все строки за один проход.
+
+    Возвращает список проблем в порядке строк: номер строки (с 1), колонка, значение и код ошибки.
+    """
+    channel = data["channel"].astype(str).str.strip()
+    partner = data["partner"].astype(str).str.strip()
+    partner_type = data["partner_type"].astype(str).str.strip()
+    publication_type = data["publication_type"].astype(str).str.strip()
+
+    masks = [
+        ("channel", channel, ErrorCode.UNKNOWN_CHANNEL, ~channel.isin(KNOWN_CHANNEL_VALUES)),
+        ("partner", partner, ErrorCode.UNKNOWN_PARTNER, ~partner.isin(KNOWN_PARTNER_VALUES) & (partner_type != "+")),
+        ("publication_type", publication_type, ErrorCode.UNKNOWN_LINK_TYPE, ~publication_type.isin(LINK_TYPE_VALUES)),
+    ]
+
+    positions = pd.RangeIndex(1, len(data) + 1)
+    issues = []
+    for column, values, code, mask in masks:
+        bad = mask.to_numpy()
+        for row, value in zip(positions[bad], values[bad]):
+            issues.append({"row": int(row), "column": column, "value": value, "error_code": code.name})
+    issues.sort(key=lambda issue: issue["row"])
+    return issues
+
+
 def validate_values(data: pd.DataFrame) -> None:
-    for _, row in data.iterrows():
-        channel = str(row["channel"]).strip()
-        try:
-            KnownChannels(channel)
-        except ValueError as e:
-            raise EnumSkillError(ErrorCode.UNKNOWN_CHANNEL, channel) from e
-        partner = str(row["partner"]).strip()
-        try:
-            KnownPartners(partner)
-        except ValueError as e:
-            if row["partner_type"].strip() != "+":
-                raise EnumSkillError(ErrorCode.UNKNOWN_PARTNER, partner) from e
-        publication_type = str(row["publication_type"]).strip()
-        get_banner_type(publication_type)
+    issues = find_invalid_values(data)
+    if not issues:
+        return
+
+    # Код ошибки — по первой проблеме, как и раньше; полный список уходит в details
+    first = issues[0]
+    raise EnumSkillError(ErrorCode[first["error_code"]], first["value"], details=issues)
 
 
 def validation(df: pd.DataFrame) -> EnumSkillError | None:
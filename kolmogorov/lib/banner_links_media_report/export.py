@@ -0,0 +1,177 @@
+from collections.abc import Iterable, Iterator
+from enum import Enum
+from typing import Any, Final, TextIO
+
+import numpy as np
+import pandas as pd
+
+from lib.reports.banner_links_media_report.parsing import table_parse
+
+
+class ReportFormat(Enum):
+    CSV = "csv"
+    PARQUET = "parquet"
+    XLSX = "xlsx"
+
+    @property
+    def extension(self) -> str:
+        return f".{self.value}"
+
+
+EXPORT_CHUNK_ROWS: Final = 5000
+TOTAL_ROW_ID: Final = "Итог"
+
+REPORT_RENAMES: Final = {
+    "link": "Ссылка",
+    "title": "Название публикации",
+    "publication_type": "Тип публикации",
+    "channel": "Канал",
+    "partner_type": "Тип партнёра",
+    "partner": "Партнёр",
+    "fact_publication_date": "Фактическая дата публикации",
+    "clicks": "Переходы",
+    "regs": "Регистрации",
+    "active": "Активные",
+}
+
+
+PARTNER_TYPES: Final = {True: "внешний", False: "внутренний"}
+CATEGORICAL_COLUMNS: Final = ["channel", "partner", "partner_type", "publication_type"]
+
+DATE_COLUMN: Final = "Фактическая дата публикации"
+INT_COLUMNS: Final = ["Переходы", "Регистрации", "Активные"]
+RATIO_COLUMNS: Final = ["Переходы -> Регистрации", "Регистрации -> Активные"]
+XLSX_SHEET: Final = "Баннерные ссылки"
+
+
+def format_dates(values: pd.Series) -> pd.Series:  # type: ignore[type-arg]
+    """Форматирует даты в «дд.мм.гггг», пустые — в "".
+
+    dt.strftime работает построчно, поэтому форматируется только каждый уникальный день.
+    """
+    codes, days = pd.factorize(pd.to_datetime(values).dt.normalize())
+    # Код -1 у пустых дат попадает на последний элемент — ""
+    labels = np.append(days.strftime("%d.%m.%Y").to_numpy(dtype=object), "")
+    return pd.Series(labels[codes], index=values.index, dtype=object)
+
+
+def _ratio(numerator: pd.Series, denominator: pd.Series) -> pd.Series:  # type: ignore[type-arg]
+    return (numerator.astype("float64") / denominator.astype("float64") * 100).fillna(0).round()
+
+
+def format_report_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Постобработка части отчёта: разбор старых описаний, русские заголовки, конверсии.
+
+    Меняет chunk на месте.
+    """
+    chunk = table_parse(chunk)
+    # is_outer из таблиц приходит булевым, разобранные описания — уже словами
+    chunk["partner_type"] = chunk["partner_type"].map(PARTNER_TYPES).fillna(chunk["partner_type"])
+    for column in CATEGORICAL_COLUMNS:
+        chunk[column] = chunk[column].astype("category")
+    chunk.rename(columns=REPORT_RENAMES, inplace=True)
+    chunk["Переходы -> Регистрации"] = _ratio(chunk["Регистрации"], chunk["Переходы"])
+    chunk["Регистрации -> Активные"] = _ratio(chunk["Активные"], chunk["Регистрации"])
+    return chunk
+
+
+def iter_table_chunks(table: pd.DataFrame, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Отдаёт строки собранной в памяти таблицы частями в порядке выгрузки.
+
+    Порядок тот же, что у ReportBannerLinksMediaRepo.get_combined_export_q: по дате публикации
+    «дд.мм.гггг» как по строке, строка «Итог» — последней.
+    """
+    is_total = (table["id"].astype(str) == TOTAL_ROW_ID).to_numpy()
+    banners = table[~is_total]
+    order = format_dates(banners["fact_publication_date"]).to_numpy().argsort(kind="stable")
+    for start in range(0, len(order), chunk_rows):
+        yield banners.iloc[order[start : start + chunk_rows]]
+    yield table[is_total]
+
+
+def format_report_chunks(chunks: Iterable[pd.DataFrame], typed_dates: bool = False) -> Iterator[pd.DataFrame]:
+    """Форматирует части отчёта по одной, не собирая их вместе.
+
+    С typed_dates дата публикации остаётся датой, а не строкой «дд.мм.гггг».
+    """
+    for chunk in chunks:
+        chunk = chunk.copy()
+        # В колонке id рядом с номерами баннеров стоит «Итог»
+        chunk["id"] = chunk["id"].astype(str)
+        if typed_dates:
+            dates = pd.to_datetime(chunk["fact_publication_date"])
+            chunk["fact_publication_date"] = dates.dt.date.astype(object).where(dates.notna(), None)
+        else:
+            chunk["fact_publication_date"] = format_dates(chunk["fact_publication_date"])
+        yield format_report_chunk(chunk)
+
+
+def write_report_csv(chunks: Iterable[pd.DataFrame], stream: TextIO) -> None:
+    columns: list[str] | None = None
+    for chunk in format_report_chunks(chunks):
+        if columns is None:
+            columns = list(chunk.columns)
+        chunk.reindex(columns=columns).to_csv(stream, index=False, header=stream.tell() == 0)
+
+
+def _typed_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    for column in INT_COLUMNS:
+        chunk[column] = chunk[column].astype("int64")
+    # Набор категорий у каждой части свой, в файл они пишутся обычными строками
+    for column in chunk.select_dtypes("category").columns:
+        chunk[column] = chunk[column].astype(object).where(chunk[column].notna(), None)
+    return chunk
+
+
+def _parquet_schema(columns: list[str]) -> Any:
+    import pyarrow as pa
+
+    types = {DATE_COLUMN: pa.date32(), **{column: pa.int64() for column in INT_COLUMNS}}
+    types.update({column: pa.float64() for column in RATIO_COLUMNS})
+    return pa.schema([(column, types.get(column, pa.string())) for column in columns])
+
+
+def write_report_parquet(chunks: Iterable[pd.DataFrame], path: str) -> None:
+    """Пишет каждую часть отдельной группой строк; схема фиксирована, чтобы части с пустыми колонками совпадали."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for chunk in format_report_chunks(chunks, typed_dates=True):
+            chunk = _typed_chunk(chunk)
+            if writer is None:
+                writer = pq.ParquetWriter(path, _parquet_schema(list(chunk.columns)), compression="zstd")
+            writer.write_table(pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_report_xlsx(chunks: Iterable[pd.DataFrame], path: str) -> None:
+    """Пишет лист в режиме write_only: openpyxl сбрасывает строки на диск, а не держит их в памяти."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=XLSX_SHEET)
+    header = False
+    for chunk in format_report_chunks(chunks, typed_dates=True):
+        chunk = _typed_chunk(chunk)
+        if not header:
+            sheet.append(list(chunk.columns))
+            header = True
+        values = chunk.astype(object).where(chunk.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            sheet.append(list(row))
+    workbook.save(path)
+
+
+def write_report(chunks: Iterable[pd.DataFrame], path: str, report_format: ReportFormat = ReportFormat.CSV) -> None:
+    """Пишет отчёт из частей в порядке выгрузки (iter_table_chunks или серверный курсор) по одной части за раз."""
+    if report_format == ReportFormat.CSV:
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            write_report_csv(chunks, f)
+    elif report_format == ReportFormat.PARQUET:
+        write_report_parquet(chunks, path)
+    else:
+        write_report_xlsx(chunks, path)
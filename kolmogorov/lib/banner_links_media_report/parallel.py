@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from concurrent.futures import FIRST_EXCEPTION, Future, ThreadPoolExecutor, wait
+from typing import Any, Final
+
+import pandas as pd
+
+from lib.data_source import AnalyticsDB
+
+logger = logging.getLogger(__name__)
+
+REPORT_DEADLINE_SECONDS: Final = 30 * 60
+MAX_PARALLEL_QUERIES: Final = 4
+
+
+class QueryDeadlineExceeded(TimeoutError):
+    pass
+
+
+class QueryCancelled(RuntimeError):
+    pass
+
+
+class ParallelQueryRunner:
+    """Выполняет независимые запросы отчёта параллельно, каждый на своём соединении.
+
+    У всех запросов общий дедлайн: он же уходит в statement_timeout, так что база сама
+    прерывает запросы, которые не успели. Если один запрос упал, ещё не начатые отменяются,
+    уже выполняющиеся прерываются через conn.cancel() на соединениях раннера, а ошибка
+    пробрасывается сразу, не дожидаясь остальных.
+    """
+
+    def __init__(
+        self,
+        db_session: AnalyticsDB,
+        deadline_seconds: float = REPORT_DEADLINE_SECONDS,
+        max_workers: int = MAX_PARALLEL_QUERIES,
+    ) -> None:
+        self._db_session: Final = db_session
+        self._deadline: Final = time.monotonic() + deadline_seconds
+        self._max_workers: Final = max_workers
+        self._active: set[Any] = set()
+        self._active_lock = threading.Lock()
+        self._cancelled = False
+
+    def _remaining(self) -> float:
+        remaining = self._deadline - time.monotonic()
+        if remaining <= 0:
+            raise QueryDeadlineExceeded("Report query deadline exceeded")
+        return remaining
+
+    def _perform(self, q: str) -> pd.DataFrame:
+        timeout_ms = int(self._remaining() * 1000)
+        with self._db_session.get_connection() as conn:
+            with self._active_lock:
+                if self._cancelled:
+                    raise QueryCancelled("Report query cancelled after a sibling query failed")
+                self._active.add(conn)
+            try:
+                with conn.cursor() as cursor:
+                    # set local действует только до конца транзакции и не протекает в пул соединений
+                    cursor.execute(f"set local statement_timeout = {timeout_ms}")
+                    # Пустые параметры — как в perform_q, чтобы %% в тексте запросов значили одно и то же
+                    cursor.execute(q, [])
+                    cols = [column[0] for column in cursor.description]
+                    rows = cursor.fetchall()
+            finally:
+                with self._active_lock:
+                    self._active.discard(conn)
+                try:
+                    conn.rollback()
+                except Exception as e:
+                    logger.warning("Can't roll back report query connection: %s", e)
+        return pd.DataFrame(rows, columns=cols)
+
+    def _cancel_running(self) -> None:
+        with self._active_lock:
+            self._cancelled = True
+            running = list(self._active)
+        for conn in running:
+            try:
+                conn.cancel()
+            except Exception as e:
+                logger.warning("Can't cancel report query: %s", e)
+
+    def run_one(self, q: str) -> pd.DataFrame:
+        return self._perform(q)
+
+    def iter_chunks(self, q: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+        """Читает результат запроса через серверный курсор по chunk_rows строк.
+
+        В памяти одновременно не больше одной части, так что вызывающий может писать их в файл по мере чтения.
+        """
+        timeout_ms = int(self._remaining() * 1000)
+        with self._db_session.get_connection() as conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(f"set local statement_timeout = {timeout_ms}")
+                # Именованный курсор psycopg2 — это declare ... cursor в текущей транзакции
+                with conn.cursor(name=f"banner_links_media_{uuid.uuid4().hex}") as cursor:
+                    cursor.execute(q, [])
+                    while rows := cursor.fetchmany(chunk_rows):
+                        cols = [column[0] for column in cursor.description]
+                        yield pd.DataFrame(rows, columns=cols)
+            finally:
+                try:
+                    conn.rollback()
+                except Exception as e:
+                    logger.warning("Can't roll back report query connection: %s", e)
+
+    def run(self, queries: list[str]) -> list[pd.DataFrame]:
+        if len(queries) <= 1:
+            return [self._perform(q) for q in queries]
+
+        executor = ThreadPoolExecutor(max_workers=min(self._max_workers, len(queries)))
+        futures: list[Future[pd.DataFrame]] = [executor.submit(self._perform, q) for q in queries]
+        try:
+            done, not_done = wait(futures, timeout=self._remaining(), return_when=FIRST_EXCEPTION)
+            failed = [future for future in done if future.exception() is not None]
+            if failed:
+                self._cancel_running()
+                raise failed[0].exception()  # type: ignore[misc]
+            if not_done:
+                self._cancel_running()
+                raise QueryDeadlineExceeded("Report query deadline exceeded")
+            return [future.result() for future in futures]
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -25,33 +25,69 @@ KNOWN_PARTNERS = [
     "Министерства просвещения",
     "Школы-партнеры Сириуса",
 ]
+KNOWN_PARTNERS_SET = frozenset(KNOWN_PARTNERS)
 
 
-def parse(title: str) -> dict[str, str]:
-    pattern = (
-        r"Соцсеть:\s*(.*?)\.\s*"
-        r"(?:Паблик/профиль|Профиль):\s*(.*?)\.\s*"
-        r"Тип публикации:\s*(.*?)\.\s*"
-        r"Дата публикации:\s*(.*?)\.\s*"
-        r"Название публикации:\s*(.*?)\."
-    )
+TITLE_PATTERN = re.compile(
+    r"Соцсеть:\s*(.*?)\.\s*"
+    r"(?:Паблик/профиль|Профиль):\s*(.*?)\.\s*"
+    r"Тип публикации:\s*(.*?)\.\s*"
+    r"Дата публикации:\s*(.*?)\.\s*"
+    r"Название публикации:\s*(.*?)\."
+)
+TITLE_GROUPS = ["channel", "partner", "publication_type", "date_publication", "title"]
+
+
+def get_partner_type(partner: str) -> str:
+    return "внутренний" if partner in KNOWN_PARTNERS_SET else "внешний"
 
-    match = re.search(pattern, title)
+
+def parse(title: str) -> dict[str, str]:
+    match = TITLE_PATTERN.search(title)
     if not match:
         return {"title": title}
 
     channel, partner, type_publication, date_publication, name_publication = match.groups()
-    partner_type = "внутренний" if partner.strip() in KNOWN_PARTNERS else "внешний"
     return {
         "channel": channel.strip(),
         "partner": partner.strip(),
-        "partner_type": partner_type,
+        "partner_type": get_partner_type(partner.strip()),
         "publication_type": type_publication.strip(),
         "title": name_publication.strip(),
     }
 
 
+def parse_titles(titles: pd.Series) -> pd.DataFrame:  # type: ignore[type-arg]
+    """Разбирает описания старых баннеров по всей колонке сразу.
+
+    Возвращает только строки с совпадением: channel, partner, partner_type, publication_type, title.
+    """
+    extracted = titles.str.extract(TITLE_PATTERN)
+    extracted.columns = TITLE_GROUPS
+    extracted = extracted[extracted["title"].notna()]
+
+    parsed = pd.DataFrame(
+        {
+            "channel": extracted["channel"].str.strip(),
+            "partner": extracted["partner"].str.strip(),
+            "publication_type": extracted["publication_type"].str.strip(),
+            "title": extracted["title"].str.strip(),
+        },
+        index=extracted.index,
+    )
+    parsed["partner_type"] = parsed["partner"].isin(KNOWN_PARTNERS_SET).map(
+        {True: "внутренний", False: "внешний"}
+    )
+    return parsed
+
+
 def table_parse(df: pd.DataFrame) -> pd.DataFrame:
-    parsed_columns = df["title"].apply(lambda x: pd.Series(parse(x)))
-    df.update(parsed_columns)
+    """Разбирает описания старых баннеров, ещё не попавших в разобранную таблицу; остальные строки не меняются."""
+    unparsed = df["channel"].isna()
+    if not unparsed.any():
+        return df
+
+    parsed = parse_titles(df.loc[unparsed, "title"])
+    if not parsed.empty:
+        df.update(parsed)
     return df
@@ -1,86 +1,60 @@
-from typing import final
+from datetime import date, datetime
+from typing import Final, final
 
+import pandas as pd
+
+from lib.data_source import AnalyticsDB
+from lib.reports.banner_links_media_report.parsing import parse_titles
 from lib.time import TimeRange
 
+# Регистрации привязываются к переходу, если случились в течение 30 минут после него.
+# Окно задаётся диапазоном по time_created внутри lateral-подзапроса, чтобы его
+# обслуживал индекс user_course_progress (user_id, time_created).
+
+# Разобранные описания старых баннеров, по структуре повторяет analytics.banner_links_media
+LEGACY_BANNERS: Final = "analytics.banner_links_media_legacy"
+
+LEGACY_SYNC_BATCH: Final = 5000
+LEGACY_COLUMNS: Final = [
+    "banner_id",
+    "link",
+    "title",
+    "publication_type",
+    "channel",
+    "partner",
+    "is_outer",
+    "time_created",
+]
+
+# Исключённые пользователи (analytics.excluded_course_students ∪ stat.excluded_users)
+# с первичным ключом по user_id; обновляется по расписанию, см. get_refresh_excluded_q
+EXCLUDED_USERS: Final = "analytics.banner_links_media_excluded_users"
+
+# Какой по счёту переход считается фактической датой публикации
+FACT_PUBLICATION_CLICK: Final = 5
+# Первые переходы по каждому баннеру за всё время; хранится FIRST_CLICKS_STORED штук,
+# поэтому nth_click можно выбирать не больше этого числа
+FIRST_CLICKS: Final = "analytics.banner_first_clicks"
+FIRST_CLICKS_STORED: Final = 10
+# Переходы доезжают в noopolis.metrics_banner_click с опозданием, поэтому обновление
+# перечитывает это окно перед водяным знаком
+FIRST_CLICKS_LATE_HOURS: Final = 24
+
 
 @final
 class ReportBannerLinksMediaRepo:
     def __init__(self) -> None:
         pass
 
-    def get_q(self, tr: TimeRange) -> str:
-        q = f"""with excluded as (
-            select
-                user_id
-            from analytics.excluded_course_students
-            union
-            select
-                user_id
-            from stat.excluded_users
-        ),
-        clicked_banners as (
+    def get_q(self, tr: TimeRange, nth_click: int = FACT_PUBLICATION_CLICK) -> str:
+        q = f"""with clicked_banners as (
             select
                 distinct banner_id
             from noopolis.metrics_banner_click
             where {tr.as_sql('time_follow')}
         ),
-        banners_new as (
-            select
-                blm.banner_id,
-                blm.link,
-                blm.title,
-                blm.publication_type,
-                blm.channel,
-                blm.partner,
-                blm.is_outer as partner_type,
-                blm.time_created
-            from analytics.banner_links_media blm
-            where banner_id in (select banner_id from clicked_banners)
-              and not blm.is_deleted
-        ),
-        banners_old as (
-            select
-                mb.id as banner_id,
-                mb.link_reference as link,
-                mb.description as title,
-                null::text as publication_type,
-                null::text as channel,
-                null::text as partner,
-                null::boolean as partner_type,
-                mb.time_created
-            from noopolis.metrics_banner mb
-            where id in (select banner_id from clicked_banners)
-              and mb.type = 'link'
-              and mb.description like 'Соцсеть:%%'
-        ),
-        banners AS (
-            select *
-            from banners_new
-            union all
-            select o.*
-            from banners_old o
-            where not exists (
-                select 1
-                from banners_new n
-                where n.banner_id = o.banner_id
-            )
-        ),
-        banner_clicks_ordered as (
-            select
-                m.banner_id,
-                m.time_follow,
-                row_number() over (partition by m.banner_id order by m.time_follow asc) as rnk
-            from noopolis.metrics_banner_click m
-            where m.banner_id in (select banner_id from banners)
-              and {tr.as_sql('m.time_follow')}
-        ),
-        fact_pub_date as (
-            select
-                banner_id,
-                time_follow as fact_publication_date
-            from banner_clicks_ordered
-            where rnk = 5
-        ),
+        {self._banners_ctes()},
+        {self._fact_pub_date_ctes(nth_click)},
         clicks as (
             select
                 coalesce(user_id, 0) as user_id,
@@ -89,7 +63,11 @@ class ReportBannerLinksMediaRepo:
             from noopolis.metrics_banner_click
             where banner_id in (select banner_id from banners)
               and {tr.as_sql('time_follow')}
-              and coalesce(user_id, 0) not in (select user_id from excluded)
+              and not exists (
+                select 1
+                from {EXCLUDED_USERS} e
+                where e.user_id = coalesce(metrics_banner_click.user_id, 0)
+              )
         ),
         cnt_clicks as (
             select
@@ -105,11 +83,16 @@ class ReportBannerLinksMediaRepo:
                 ucp.id,
                 c.banner_id
             from clicks c
-                join noopolis.user_course_progress ucp
-                  on c.user_id = ucp.user_id
-            where ucp.time_created > c.time_follow
-              and (ucp.time_created - c.time_follow) <= interval '30 minutes'
-              and ucp.user_id not in (select user_id from excluded)
+                cross join lateral (
+                    select
+                        u.id,
+                        u.user_id,
+                        u.course_id
+                    from noopolis.user_course_progress u
+                    where u.user_id = c.user_id
+                      and u.time_created > c.time_follow
+                      and u.time_created <= c.time_follow + interval '30 minutes'
+                ) ucp
         ),
         cnt_regs as (
             select
@@ -135,7 +118,6 @@ class ReportBannerLinksMediaRepo:
               and not ump.is_deleted
               and ump.is_achieved = true
               and (ump.is_available or ump.time_updated is not null)
-              and r.user_id not in (select user_id from excluded)
         ),
         cnt_active as (
             select
@@ -169,22 +151,17 @@ class ReportBannerLinksMediaRepo:
         return q
 
     def get_all_q(self, tr: TimeRange) -> str:
-        q = f"""with excluded as (
-            select
-                user_id
-            from analytics.excluded_course_students
-            union
-            select
-                user_id
-            from stat.excluded_users
-        ),
-        clicks as (
+        q = f"""with clicks as (
             select
                 coalesce(user_id, 0) as user_id,
                 time_follow
             from noopolis.metrics_banner_click
             where {tr.as_sql('time_follow')}
-              and coalesce(user_id, 0) not in (select user_id from excluded)
+              and not exists (
+                select 1
+                from {EXCLUDED_USERS} e
+                where e.user_id = coalesce(metrics_banner_click.user_id, 0)
+              )
         ),
         total_clicks as (
             select
@@ -197,11 +174,16 @@ class ReportBannerLinksMediaRepo:
                 ucp.user_id,
                 ucp.course_id
             from clicks c
-                join noopolis.user_course_progress ucp
-                  on c.user_id = ucp.user_id
-            where ucp.time_created > c.time_follow
-              and (ucp.time_created - c.time_follow) <= interval '30 minutes'
-              and ucp.user_id not in (select user_id from excluded)
+                cross join lateral (
+                    select
+                        u.id,
+                        u.user_id,
+                        u.course_id
+                    from noopolis.user_course_progress u
+                    where u.user_id = c.user_id
+                      and u.time_created > c.time_follow
+                      and u.time_created <= c.time_follow + interval '30 minutes'
+                ) ucp
         ),
         total_regs as (
             select
@@ -224,7 +206,6 @@ class ReportBannerLinksMediaRepo:
               and not ump.is_deleted
               and ump.is_achieved = true
               and (ump.is_available or ump.time_updated is not null)
-              and r.user_id not in (select user_id from excluded)
         ),
         total_active as (
             select
@@ -245,3 +226,608 @@ class ReportBannerLinksMediaRepo:
             (select total_active from total_active) as active
         """  # noqa: S608
         return q
+
+    def get_daily_q(
+        self,
+        tr: TimeRange,
+        partition: tuple[int, int] | None = None,
+        count_from: datetime | None = None,
+    ) -> str:
+        """Метрики по баннеру за каждый день диапазона.
+
+        Регистрации и активации хранятся множествами id, а не счётчиками,
+        чтобы при объединении дней distinct оставался точным.
+        partition=(k, n) оставляет только баннеры с banner_id % n = k: все метрики
+        считаются по баннеру, так что части можно считать независимо и просто склеить.
+        count_from — для дочитывания после водяного знака: переходы считаются только начиная с него,
+        а более ранние переходы диапазона нужны лишь для привязки новых регистраций.
+        """
+        # Запросы выполняются с параметрами, поэтому литеральный % удваивается
+        partition_filter = f"and banner_id %% {partition[1]} = {partition[0]}" if partition is not None else ""
+        # Диапазоны полуоткрытые: переход ровно на водяном знаке в срез до него не попал
+        clicks_filter = f"where time_follow >= '{count_from:%Y-%m-%d %H:%M:%S}'" if count_from is not None else ""
+        q = f"""with all_clicks as (
+            select
+                banner_id,
+                coalesce(user_id, 0) as user_id,
+                time_follow,
+                time_follow::date as day
+            from noopolis.metrics_banner_click
+            where {tr.as_sql('time_follow')}
+              {partition_filter}
+        ),
+        clicks as (
+            select *
+            from all_clicks
+            where not exists (
+                select 1
+                from {EXCLUDED_USERS} e
+                where e.user_id = all_clicks.user_id
+            )
+        ),
+        banner_days as (
+            select
+                distinct day,
+                banner_id
+            from all_clicks
+        ),
+        cnt_clicks as (
+            select
+                day,
+                banner_id,
+                count(*) as clicks
+            from clicks
+            {clicks_filter}
+            group by day, banner_id
+        ),
+        regs as (
+            select
+                ucp.user_id,
+                ucp.course_id,
+                ucp.id,
+                c.banner_id,
+                c.day
+            from clicks c
+                cross join lateral (
+                    select
+                        u.id,
+                        u.user_id,
+                        u.course_id
+                    from noopolis.user_course_progress u
+                    where u.user_id = c.user_id
+                      and u.time_created > c.time_follow
+                      and u.time_created <= c.time_follow + interval '30 minutes'
+                ) ucp
+        ),
+        reg_ids as (
+            select
+                day,
+                banner_id,
+                array_agg(distinct id) as reg_ids
+            from regs
+            group by day, banner_id
+        ),
+        active as (
+            select
+                ump.user_id,
+                ump.course_id,
+                r.id as reg_id,
+                r.banner_id,
+                r.day
+            from regs r
+                join noopolis.user_module_progress ump
+                  on ump.course_progress_id = r.id
+                join noopolis.course_module cm
+                  on cm.id = ump.course_module_id
+            where cm.type = 'ordinary'
+              and cm.level = 1
+              and not cm.is_deleted
+              and not ump.is_deleted
+              and ump.is_achieved = true
+              and (ump.is_available or ump.time_updated is not null)
+        ),
+        active_ids as (
+            select
+                day,
+                banner_id,
+                array_agg(distinct reg_id) as active_reg_ids,
+                array_agg(distinct user_id || ':' || course_id) as active_keys
+            from active
+            group by day, banner_id
+        )
+        select
+            f.day,
+            f.banner_id,
+            coalesce(c.clicks, 0) as clicks,
+            coalesce(r.reg_ids, '{{}}') as reg_ids,
+            coalesce(a.active_reg_ids, '{{}}') as active_reg_ids,
+            coalesce(a.active_keys, '{{}}') as active_keys
+        from banner_days f
+            left join cnt_clicks c
+              on c.day = f.day and c.banner_id = f.banner_id
+            left join reg_ids r
+              on r.day = f.day and r.banner_id = f.banner_id
+            left join active_ids a
+              on a.day = f.day and a.banner_id = f.banner_id
+        """  # noqa: S608
+        return q
+
+    def get_activations_q(self, reg_ids: list[int]) -> str:
+        """Текущие активации регистраций reg_ids с теми же условиями, что active в get_daily_q.
+
+        Освежает кэшированный срез текущего дня: дельта по новым переходам не видит активации
+        регистраций, которые уже есть в срезе.
+        """
+        ids = ",".join(str(int(reg_id)) for reg_id in reg_ids)
+        q = f"""select
+            ump.course_progress_id as reg_id,
+            ump.user_id || ':' || ump.course_id as active_key
+        from noopolis.user_module_progress ump
+            join noopolis.course_module cm
+              on cm.id = ump.course_module_id
+        where ump.course_progress_id = any('{{{ids}}}'::bigint[])
+          and cm.type = 'ordinary'
+          and cm.level = 1
+          and not cm.is_deleted
+          and not ump.is_deleted
+          and ump.is_achieved = true
+          and (ump.is_available or ump.time_updated is not null)
+        """  # noqa: S608
+        return q
+
+    def get_daily_partitioned_q(
+        self,
+        tr: TimeRange,
+        partitions: int,
+        count_from: datetime | None = None,
+    ) -> list[str]:
+        if partitions <= 1:
+            return [self.get_daily_q(tr, count_from=count_from)]
+        return [self.get_daily_q(tr, (k, partitions), count_from) for k in range(partitions)]
+
+    def get_refresh_daily_q(self, from_date: date, to_date: date, tr: TimeRange) -> list[str]:
+        """Запросы пересчёта дневного агрегата за дни [from_date, to_date]; выполняются в одной транзакции."""
+        return [
+            f"""delete from analytics.banner_links_media_daily
+            where day between '{from_date}'::date and '{to_date}'::date
+            """,  # noqa: S608
+            f"""insert into analytics.banner_links_media_daily(
+                day, banner_id, clicks, reg_ids, active_reg_ids, active_keys
+            )
+            select *
+            from ({self.get_daily_q(tr)}) daily
+            where day between '{from_date}'::date and '{to_date}'::date
+            """,  # noqa: S608
+            f"""insert into analytics.banner_links_media_daily_state(day, time_refreshed)
+            select
+                d::date,
+                now()
+            from generate_series('{from_date}'::date, '{to_date}'::date, interval '1 day') d
+            on conflict (day) do update
+                set time_refreshed = excluded.time_refreshed
+            """,  # noqa: S608
+        ]
+
+    def get_refresh_first_clicks_q(self) -> list[str]:
+        """Пересчитывает FIRST_CLICKS для баннеров с переходами после водяного знака за вычетом FIRST_CLICKS_LATE_HOURS.
+
+        Новый водяной знак фиксируется в начале, так что переходы, пришедшие во время
+        обновления, достанутся следующему запуску. Окно опоздания перечитывается каждый раз,
+        чтобы переходы, загруженные позже с более ранним time_follow, не терялись. Первые переходы
+        задетых баннеров набираются заново из metrics_banner_click, а не сливаются с сохранёнными:
+        так повтор окна не задваивает переходы, а одинаковые моменты не схлопываются. Баннер
+        с полным набором не трогается, только если его последний сохранённый переход старше окна опоздания.
+        """
+        return [
+            "lock table analytics.banner_first_clicks_state in exclusive mode",
+            f"""with state as (
+                select
+                    coalesce(max(watermark), '-infinity'::timestamp) as watermark
+                from analytics.banner_first_clicks_state
+            ),
+            bound as (
+                select
+                    coalesce(max(time_follow), (select watermark from state)) as watermark
+                from noopolis.metrics_banner_click
+                where time_follow > (select watermark from state)
+            ),
+            touched as (
+                select
+                    distinct m.banner_id
+                from noopolis.metrics_banner_click m
+                where m.time_follow > (select watermark from state) - interval '{FIRST_CLICKS_LATE_HOURS} hours'
+                  and m.time_follow <= (select watermark from bound)
+                  and not exists (
+                    select 1
+                    from {FIRST_CLICKS} fc
+                    where fc.banner_id = m.banner_id
+                      and cardinality(fc.first_clicks) >= {FIRST_CLICKS_STORED}
+                      and fc.first_clicks[{FIRST_CLICKS_STORED}]
+                          <= (select watermark from state) - interval '{FIRST_CLICKS_LATE_HOURS} hours'
+                  )
+            ),
+            new_clicks as (
+                select
+                    t.banner_id,
+                    array(
+                        select
+                            m.time_follow
+                        from noopolis.metrics_banner_click m
+                        where m.banner_id = t.banner_id
+                          and m.time_follow <= (select watermark from bound)
+                        order by m.time_follow
+                        limit {FIRST_CLICKS_STORED}
+                    ) as first_clicks
+                from touched t
+            ),
+            upserted as (
+                insert into {FIRST_CLICKS}(banner_id, first_clicks, time_updated)
+                select
+                    banner_id,
+                    first_clicks,
+                    now()
+                from new_clicks
+                on conflict (banner_id) do update
+                    set first_clicks = excluded.first_clicks,
+                        time_updated = excluded.time_updated
+            )
+            insert into analytics.banner_first_clicks_state(id, watermark)
+            select
+                1,
+                watermark
+            from bound
+            where watermark is not null
+            on conflict (id) do update
+                set watermark = excluded.watermark
+            """,  # noqa: S608
+        ]
+
+    def get_refresh_excluded_q(self) -> str:
+        return f"refresh materialized view concurrently {EXCLUDED_USERS}"
+
+    def _banners_ctes(self) -> str:
+        # Баннеры из clicked_banners: новые из analytics.banner_links_media, старые — из разобранной
+        # LEGACY_BANNERS, а ещё не синхронизированные старые — сырыми описаниями из metrics_banner
+        return f"""banners_new as (
+            select
+                blm.banner_id,
+                blm.link,
+                blm.title,
+                blm.publication_type,
+                blm.channel,
+                blm.partner,
+                blm.is_outer as partner_type,
+                blm.time_created
+            from analytics.banner_links_media blm
+            where banner_id in (select banner_id from clicked_banners)
+              and not blm.is_deleted
+        ),
+        banners_legacy as (
+            select
+                bl.banner_id,
+                bl.link,
+                bl.title,
+                bl.publication_type,
+                bl.channel,
+                bl.partner,
+                bl.is_outer as partner_type,
+                bl.time_created
+            from {LEGACY_BANNERS} bl
+            where banner_id in (select banner_id from clicked_banners)
+        ),
+        banners_old as (
+            select
+                mb.id as banner_id,
+                mb.link_reference as link,
+                mb.description as title,
+                null::text as publication_type,
+                null::text as channel,
+                null::text as partner,
+                null::boolean as partner_type,
+                mb.time_created
+            from noopolis.metrics_banner mb
+            where id in (select banner_id from clicked_banners)
+              and mb.type = 'link'
+              and mb.description like 'Соцсеть:%%'
+              and not exists (
+                select 1
+                from {LEGACY_BANNERS} bl
+                where bl.banner_id = mb.id
+              )
+        ),
+        banners AS (
+            select *
+            from banners_new
+            union all
+            select o.*
+            from (
+                select * from banners_legacy
+                union all
+                select * from banners_old
+            ) o
+            where not exists (
+                select 1
+                from banners_new n
+                where n.banner_id = o.banner_id
+            )
+        )"""
+
+    def _fact_pub_date_ctes(self, nth_click: int) -> str:
+        # Дата nth_click-го перехода по баннерам из banners. Если в FIRST_CLICKS их меньше,
+        # сохранённые переходы (все до водяного знака) дополняются переходами после него,
+        # чтобы у новых баннеров дата появлялась до следующего обновления FIRST_CLICKS
+        return f"""first_clicks_state as (
+            select
+                coalesce(max(watermark), '-infinity'::timestamp) as watermark
+            from analytics.banner_first_clicks_state
+        ),
+        fact_pub_date as (
+            select
+                b.banner_id,
+                case
+                    when cardinality(fc.first_clicks) >= {nth_click} then fc.first_clicks[{nth_click}]
+                    else (
+                        coalesce(fc.first_clicks, array[]::timestamp[]) || array(
+                            select
+                                m.time_follow
+                            from noopolis.metrics_banner_click m
+                            where m.banner_id = b.banner_id
+                              and m.time_follow > (select watermark from first_clicks_state)
+                            order by m.time_follow
+                            limit {nth_click}
+                        )
+                    )[{nth_click}]
+                end as fact_publication_date
+            from (select distinct banner_id from banners) b
+                left join {FIRST_CLICKS} fc
+                  on fc.banner_id = b.banner_id
+        )"""
+
+    def get_legacy_banners_q(self) -> str:
+        """Старые баннеры с описанием «Соцсеть: ...» после заданного id; параметры — id и размер пачки."""
+        return """select
+            mb.id as banner_id,
+            mb.link_reference as link,
+            mb.description,
+            mb.time_created
+        from noopolis.metrics_banner mb
+        where mb.type = 'link'
+          and mb.description like 'Соцсеть:%%'
+          and mb.id > %s
+        order by mb.id
+        limit %s
+        """
+
+    def get_daily_rollup_q(self, from_date: date, to_date: date) -> str:
+        """Готовые дни дневного агрегата за [from_date, to_date]."""
+        q = f"""select
+            d.day,
+            d.banner_id,
+            d.clicks,
+            d.reg_ids,
+            d.active_reg_ids,
+            d.active_keys,
+            s.day as ready_day
+        from analytics.banner_links_media_daily_state s
+            left join analytics.banner_links_media_daily d
+              on d.day = s.day
+        where s.day between '{from_date}'::date and '{to_date}'::date
+        """  # noqa: S608
+        return q
+
+    def get_banners_q(self, banner_ids: list[int], nth_click: int = FACT_PUBLICATION_CLICK) -> str:
+        ids = ", ".join(str(int(banner_id)) for banner_id in banner_ids)
+        q = f"""with clicked_banners as (
+            select
+                unnest(array[{ids}]::bigint[]) as banner_id
+        ),
+        {self._banners_ctes()},
+        {self._fact_pub_date_ctes(nth_click)}
+        select
+            b.banner_id,
+            b.link,
+            b.channel,
+            b.partner,
+            b.partner_type,
+            b.publication_type,
+            fp.fact_publication_date,
+            b.title
+        from banners b
+            left join fact_pub_date fp
+              on fp.banner_id = b.banner_id
+        """  # noqa: S608
+        return q
+
+    def get_combined_export_q(self, tr: TimeRange, nth_click: int = FACT_PUBLICATION_CLICK) -> str:
+        """get_combined_q в порядке выгрузки, чтобы результат можно было писать в файл по мере чтения курсором.
+
+        Порядок как у export.iter_table_chunks: дата «дд.мм.гггг» сравнивается как строка, «Итог» — последним.
+        """
+        return f"""select *
+        from ({self.get_combined_q(tr, nth_click)}) report
+        order by
+            report.id = 'Итог',
+            coalesce(to_char(report.fact_publication_date, 'DD.MM.YYYY'), '') collate "C"
+        """
+
+    def get_combined_q(self, tr: TimeRange, nth_click: int = FACT_PUBLICATION_CLICK) -> str:
+        """Строки по баннерам и строка «Итог» за один проход по переходам.
+
+        Итог, как и в get_all_q, считается по всем баннерам, а не только по медийным.
+        """
+        q = f"""with all_clicks as materialized (
+            select
+                coalesce(user_id, 0) as user_id,
+                banner_id,
+                time_follow
+            from noopolis.metrics_banner_click
+            where {tr.as_sql('time_follow')}
+        ),
+        clicked_banners as (
+            select
+                distinct banner_id
+            from all_clicks
+        ),
+        {self._banners_ctes()},
+        {self._fact_pub_date_ctes(nth_click)},
+        clicks as materialized (
+            select *
+            from all_clicks
+            where not exists (
+                select 1
+                from {EXCLUDED_USERS} e
+                where e.user_id = all_clicks.user_id
+            )
+        ),
+        cnt_clicks as (
+            select
+                banner_id,
+                count(*) as clicks,
+                grouping(banner_id) as is_total
+            from clicks
+            group by grouping sets ((banner_id), ())
+        ),
+        regs as materialized (
+            select
+                ucp.user_id,
+                ucp.course_id,
+                ucp.id,
+                c.banner_id
+            from clicks c
+                cross join lateral (
+                    select
+                        u.id,
+                        u.user_id,
+                        u.course_id
+                    from noopolis.user_course_progress u
+                    where u.user_id = c.user_id
+                      and u.time_created > c.time_follow
+                      and u.time_created <= c.time_follow + interval '30 minutes'
+                ) ucp
+        ),
+        cnt_regs as (
+            select
+                banner_id,
+                count(distinct id) as regs,
+                grouping(banner_id) as is_total
+            from regs
+            group by grouping sets ((banner_id), ())
+        ),
+        active as (
+            select
+                ump.user_id,
+                ump.course_id,
+                r.id as reg_id,
+                r.banner_id
+            from regs r
+                join noopolis.user_module_progress ump
+                  on ump.course_progress_id = r.id
+                join noopolis.course_module cm
+                  on cm.id = ump.course_module_id
+            where cm.type = 'ordinary'
+              and cm.level = 1
+              and not cm.is_deleted
+              and not ump.is_deleted
+              and ump.is_achieved = true
+              and (ump.is_available or ump.time_updated is not null)
+        ),
+        cnt_active as (
+            select
+                banner_id,
+                count(distinct (user_id, course_id)) as active,
+                count(distinct reg_id) as active_regs,
+                grouping(banner_id) as is_total
+            from active
+            group by grouping sets ((banner_id), ())
+        )
+        select
+            b.banner_id::text as id,
+            b.link,
+            b.channel,
+            b.partner,
+            b.partner_type,
+            b.publication_type,
+            fp.fact_publication_date,
+            b.title,
+            coalesce(c.clicks, 0) as clicks,
+            coalesce(r.regs, 0) as regs,
+            coalesce(a.active, 0) as active
+        from banners b
+            left join fact_pub_date fp
+              on fp.banner_id = b.banner_id
+            left join cnt_clicks c
+              on c.banner_id = b.banner_id
+             and c.is_total = 0
+            left join cnt_regs r
+              on r.banner_id = b.banner_id
+             and r.is_total = 0
+            left join cnt_active a
+              on a.banner_id = b.banner_id
+             and a.is_total = 0
+        union all
+        select
+            'Итог' as id,
+            null as link,
+            null as channel,
+            null as partner,
+            null as partner_type,
+            null as publication_type,
+            null as fact_publication_date,
+            null as title,
+            coalesce((select clicks from cnt_clicks where is_total = 1), 0) as clicks,
+            coalesce((select regs from cnt_regs where is_total = 1), 0) as regs,
+            coalesce((select active_regs from cnt_active where is_total = 1), 0) as active
+        """  # noqa: S608
+        return q
+
+
+class AnalyticsLegacyBanners:
+    """Синхронизация LEGACY_BANNERS: описания старых баннеров разбираются один раз и хранятся колонками."""
+
+    def __init__(self, db_session: AnalyticsDB) -> None:
+        self._db_session: Final = db_session
+
+    def sync(self, batch_size: int = LEGACY_SYNC_BATCH) -> int:
+        """Дописывает баннеры с id больше уже разобранных; первый запуск — полный бэкфилл. Возвращает число строк."""
+        repo = ReportBannerLinksMediaRepo()
+        synced = 0
+        with self._db_session.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"select coalesce(max(banner_id), 0) from {LEGACY_BANNERS}")  # noqa: S608
+                last_id = cursor.fetchone()[0]
+
+            while True:
+                with conn.cursor() as cursor:
+                    cursor.execute(repo.get_legacy_banners_q(), (last_id, batch_size))
+                    rows = cursor.fetchall()
+                if not rows:
+                    break
+
+                batch = pd.DataFrame(rows, columns=["banner_id", "link", "description", "time_created"])
+                parsed = parse_titles(batch["description"])
+                batch = batch.join(parsed)
+                # Описание без совпадения сохраняем целиком как название, как и при разборе в отчёте
+                batch["title"] = batch["title"].fillna(batch["description"])
+                batch["is_outer"] = batch["partner_type"].map({"внутренний": False, "внешний": True})
+                batch = batch.astype(object).where(batch.notna(), None)
+
+                with conn.cursor() as cursor:
+                    values = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s)"] * len(batch))
+                    cursor.execute(
+                        f"""
+                        insert into {LEGACY_BANNERS}(
+                            banner_id, link, title, publication_type, channel, partner, is_outer, time_created
+                        )
+                        values {values}
+                        on conflict (banner_id) do nothing
+                        """,  # noqa: S608
+                        [
+                            value
+                            for row in batch[LEGACY_COLUMNS].itertuples(index=False)
+                            for value in row
+                        ],
+                    )
+                conn.commit()
+                synced += len(batch)
+                last_id = int(batch["banner_id"].iloc[-1])
+        return synced
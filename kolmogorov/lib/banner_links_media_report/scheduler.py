@@ -0,0 +1,89 @@
+import logging
+import threading
+import time
+import zlib
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Final
+
+from lib.data_source import AnalyticsDB
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_TICK_SECONDS: Final = 60
+
+
+@dataclass(frozen=True)
+class ScheduledJob:
+    name: str
+    interval_seconds: float
+    run: Callable[[AnalyticsDB], None]
+
+
+class JobScheduler:
+    """Запускает плановые обновления в фоновом потоке процесса, каждое со своим интервалом.
+
+    Процессов API несколько, поэтому обновление выполняется под advisory-блокировкой в базе:
+    пока оно идёт в одном процессе, остальные пропускают его до своего следующего срока.
+    Упавшее обновление пишется в лог и повторяется через свой интервал.
+    """
+
+    def __init__(self, jobs: list[ScheduledJob], tick_seconds: float = SCHEDULER_TICK_SECONDS) -> None:
+        self._jobs: Final = jobs
+        self._tick_seconds: Final = tick_seconds
+        self._next_run = {job.name: 0.0 for job in jobs}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def start(self, db_session: AnalyticsDB) -> None:
+        """Запускает фоновый поток; повторные вызовы ничего не делают."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, args=(db_session,), name="banner-links-media-scheduler", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self, db_session: AnalyticsDB) -> None:
+        while True:
+            self.run_due(db_session)
+            time.sleep(self._tick_seconds)
+
+    def run_due(self, db_session: AnalyticsDB, now: float | None = None) -> list[str]:
+        """Выполняет по порядку обновления, срок которых подошёл; возвращает имена выполненных."""
+        now = time.monotonic() if now is None else now
+        done = []
+        for job in self._jobs:
+            if self._next_run[job.name] > now:
+                continue
+            self._next_run[job.name] = now + job.interval_seconds
+            try:
+                if _run_locked(db_session, job):
+                    done.append(job.name)
+            except Exception:
+                logger.exception("Scheduled job %s failed", job.name)
+        return done
+
+
+def _run_locked(db_session: AnalyticsDB, job: ScheduledJob) -> bool:
+    lock_id = zlib.crc32(f"banner_links_media.{job.name}".encode())
+    with db_session.get_connection() as conn:
+        # Блокировка уровня сессии переживает commit и держится, пока идёт обновление
+        with conn.cursor() as cursor:
+            cursor.execute("select pg_try_advisory_lock(%s)", (lock_id,))
+            locked = cursor.fetchone()[0]
+        conn.commit()
+        if not locked:
+            logger.info("Scheduled job %s is running in another process, skipped", job.name)
+            return False
+
+        try:
+            started = time.monotonic()
+            job.run(db_session)
+            logger.info("Scheduled job %s done in %.1fs", job.name, time.monotonic() - started)
+        finally:
+            with conn.cursor() as cursor:
+                cursor.execute("select pg_advisory_unlock(%s)", (lock_id,))
+            conn.commit()
+    return True
@@ -0,0 +1,37 @@
+import threading
+from collections.abc import Callable, Hashable
+from concurrent.futures import Future
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """Объединяет одновременные вызовы с одинаковым ключом: считает первый, остальные ждут его результат."""
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, Future[T]] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> tuple[T, bool]:
+        """Возвращает результат и признак того, что он получен от уже идущего вызова."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                is_shared = True
+            else:
+                future = Future()
+                self._calls[key] = future
+                is_shared = False
+
+        if is_shared:
+            return future.result(), True
+
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result(), False
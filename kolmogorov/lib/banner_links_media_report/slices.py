@@ -0,0 +1,273 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from itertools import chain
+from typing import Final
+
+import pandas as pd
+
+from lib.reports.banner_links_media_report.parallel import ParallelQueryRunner
+from lib.reports.banner_links_media_report.repo import ReportBannerLinksMediaRepo
+from lib.time import TimeRange, parse_time
+
+logger = logging.getLogger(__name__)
+
+DAILY_COLUMNS: Final = ["day", "banner_id", "clicks", "reg_ids", "active_reg_ids", "active_keys"]
+ID_COLUMNS: Final = ["reg_ids", "active_reg_ids", "active_keys"]
+METRIC_COLUMNS: Final = ["banner_id", "clicks", "regs", "active"]
+
+SLICE_CACHE_MAX_DAYS: Final = 400
+# Активации дозревают задним числом, поэтому срез дня не держим дольше нескольких часов
+SLICE_CACHE_TTL_SECONDS: Final = 6 * 60 * 60
+
+
+class DaySliceCache:
+    """Кэш дневных срезов отчёта в памяти процесса с вытеснением по возрасту и по числу дней."""
+
+    def __init__(self, max_days: int = SLICE_CACHE_MAX_DAYS, ttl_seconds: float = SLICE_CACHE_TTL_SECONDS) -> None:
+        self._max_days: Final = max_days
+        self._ttl_seconds: Final = ttl_seconds
+        self._data: OrderedDict[date, tuple[float, pd.DataFrame]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, days: list[date]) -> dict[date, pd.DataFrame]:
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for day in days:
+                item = self._data.get(day)
+                if item is None:
+                    continue
+                created_at, frame = item
+                if now - created_at > self._ttl_seconds:
+                    del self._data[day]
+                    continue
+                self._data.move_to_end(day)
+                found[day] = frame
+        return found
+
+    def put_many(self, slices: dict[date, pd.DataFrame]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for day, frame in slices.items():
+                self._data[day] = (now, frame)
+                self._data.move_to_end(day)
+            while len(self._data) > self._max_days:
+                self._data.popitem(last=False)
+
+
+day_slice_cache: Final = DaySliceCache()
+
+LIVE_SLICE_CACHE_MAX_ITEMS: Final = 64
+# Отчёт с текущим днём отдаётся из кэша без запросов, пока срез моложе этого возраста
+LIVE_SLICE_TTL_SECONDS: Final = 5 * 60
+# Дельтами срез дочитывается не дольше этого срока после полного расчёта, потом считается заново
+LIVE_SLICE_MAX_AGE_SECONDS: Final = 60 * 60
+
+
+@dataclass(frozen=True)
+class LiveSlice:
+    """Срез текущего дня и водяной знак: переходы до него уже учтены в frame.
+
+    computed_at — время последнего полного расчёта, created_at — последнего обновления дельтой.
+    """
+
+    created_at: float
+    computed_at: float
+    watermark: datetime
+    frame: pd.DataFrame
+
+
+class LiveSliceCache:
+    """Кэш срезов текущего дня по диапазону (from, to) с коротким сроком свежести.
+
+    По устаревшему срезу дочитывается только дельта после водяного знака, но не дольше
+    max_age_seconds после полного расчёта: более старый срез выбрасывается.
+    """
+
+    def __init__(
+        self,
+        max_items: int = LIVE_SLICE_CACHE_MAX_ITEMS,
+        ttl_seconds: float = LIVE_SLICE_TTL_SECONDS,
+        max_age_seconds: float = LIVE_SLICE_MAX_AGE_SECONDS,
+    ) -> None:
+        self._max_items: Final = max_items
+        self._ttl_seconds: Final = ttl_seconds
+        self._max_age_seconds: Final = max_age_seconds
+        self._data: OrderedDict[tuple[datetime, datetime], LiveSlice] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict_expired(self, now: float) -> None:
+        expired = [key for key, item in self._data.items() if now - item.computed_at > self._max_age_seconds]
+        for key in expired:
+            del self._data[key]
+
+    def get(self, key: tuple[datetime, datetime]) -> LiveSlice | None:
+        with self._lock:
+            self._evict_expired(time.monotonic())
+            item = self._data.get(key)
+            if item is not None:
+                self._data.move_to_end(key)
+            return item
+
+    def is_fresh(self, item: LiveSlice) -> bool:
+        return time.monotonic() - item.created_at <= self._ttl_seconds
+
+    def put(
+        self,
+        key: tuple[datetime, datetime],
+        watermark: datetime,
+        frame: pd.DataFrame,
+        computed_at: float | None = None,
+    ) -> None:
+        """Кладёт срез; computed_at передаётся, когда срез получен дельтой из более старого."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            self._data[key] = LiveSlice(now, computed_at if computed_at is not None else now, watermark, frame)
+            self._data.move_to_end(key)
+            while len(self._data) > self._max_items:
+                self._data.popitem(last=False)
+
+
+live_slice_cache: Final = LiveSliceCache()
+
+
+def split_by_day(daily: pd.DataFrame, days: list[date]) -> dict[date, pd.DataFrame]:
+    """Раскладывает строки get_daily_q по дням; дни без переходов получают пустой срез."""
+    groups = {day: frame for day, frame in daily.groupby("day")} if not daily.empty else {}
+    return {day: groups.get(day, daily.iloc[0:0]) for day in days}
+
+
+def combine_daily(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """Склеивает строки get_daily_q по (day, banner_id): переходы суммируются, множества id объединяются."""
+    daily = pd.concat(frames, ignore_index=True)[DAILY_COLUMNS]
+    if daily.empty:
+        return daily
+    rows = [
+        {
+            "day": day,
+            "banner_id": banner_id,
+            "clicks": int(group["clicks"].sum()),
+            **{column: list(set(chain.from_iterable(group[column]))) for column in ID_COLUMNS},
+        }
+        for (day, banner_id), group in daily.groupby(["day", "banner_id"], sort=False)
+    ]
+    return pd.DataFrame(rows, columns=DAILY_COLUMNS)
+
+
+def refresh_activations(daily: pd.DataFrame, activations: pd.DataFrame) -> pd.DataFrame:
+    """Заменяет активации в строках get_daily_q текущими из get_activations_q по тем же регистрациям.
+
+    Модуль проходят позже регистрации, поэтому в срезе, посчитанном раньше, активаций может не хватать.
+    """
+    keys: dict[int, set[str]] = {}
+    for reg_id, active_key in zip(activations["reg_id"], activations["active_key"]):
+        keys.setdefault(int(reg_id), set()).add(active_key)
+
+    daily = daily.copy()
+    active_reg_ids = [[reg_id for reg_id in reg_ids if reg_id in keys] for reg_ids in daily["reg_ids"]]
+    daily["active_reg_ids"] = active_reg_ids
+    daily["active_keys"] = [list(set(chain.from_iterable(keys[reg_id] for reg_id in ids))) for ids in active_reg_ids]
+    return daily
+
+
+def _union_size(values: pd.Series) -> int:  # type: ignore[type-arg]
+    return len(set(chain.from_iterable(values)))
+
+
+def merge_slices(daily: pd.DataFrame) -> tuple[pd.DataFrame, dict[str, int]]:
+    """Собирает метрики диапазона из дневных срезов: по баннерам и итог.
+
+    Итог считается так же, как в get_all_q: по всем баннерам, активные — по регистрациям.
+    """
+    if daily.empty:
+        return pd.DataFrame(columns=METRIC_COLUMNS), {"clicks": 0, "regs": 0, "active": 0}
+
+    grouped = daily.groupby("banner_id", sort=False)
+    per_banner = pd.DataFrame(
+        {
+            "clicks": grouped["clicks"].sum(),
+            "regs": grouped["reg_ids"].agg(_union_size),
+            "active": grouped["active_keys"].agg(_union_size),
+        }
+    ).reset_index()
+    totals = {
+        "clicks": int(daily["clicks"].sum()),
+        "regs": _union_size(daily["reg_ids"]),
+        "active": _union_size(daily["active_reg_ids"]),
+    }
+    return per_banner, totals
+
+
+def _day_runs(days: list[date]) -> list[tuple[date, date]]:
+    runs: list[tuple[date, date]] = []
+    for day in days:
+        if runs and runs[-1][1] + timedelta(days=1) == day:
+            runs[-1] = (runs[-1][0], day)
+        else:
+            runs.append((day, day))
+    return runs
+
+
+def load_daily_slices(
+    runner: ParallelQueryRunner,
+    repo: ReportBannerLinksMediaRepo,
+    from_date: date,
+    to_date: date,
+    live_queries: list[str],
+    partitions: int = 1,
+    cache: DaySliceCache = day_slice_cache,
+) -> tuple[list[pd.DataFrame], list[pd.DataFrame]]:
+    """Дневные срезы закрытых дней: кэш в памяти, затем дневной агрегат, затем сырые таблицы.
+
+    Запросы текущего дня (live_queries) выполняются параллельно с чтением агрегата;
+    их результаты возвращаются вторым списком как есть.
+    """
+    days = [from_date + timedelta(days=i) for i in range((to_date - from_date).days + 1)]
+    slices = cache.get_many(days)
+    missing = [day for day in days if day not in slices]
+
+    queries = [repo.get_daily_rollup_q(missing[0], missing[-1])] if missing else []
+    results = runner.run(queries + live_queries)
+    live = results[len(queries) :]
+
+    if missing:
+        rollup = results[0]
+        ready_days = set(rollup["ready_day"])
+        ready = [day for day in missing if day in ready_days]
+        loaded = split_by_day(rollup.dropna(subset=["banner_id"])[DAILY_COLUMNS], ready)
+
+        # Непрерывные отрезки дней, которых нет нигде, считаем по сырым таблицам параллельно
+        to_compute = [day for day in missing if day not in loaded]
+        runs = _day_runs(to_compute)
+        run_queries = [
+            repo.get_daily_partitioned_q(
+                TimeRange(
+                    from_in=parse_time(run_start.isoformat()),
+                    to_in=parse_time((run_end + timedelta(days=1)).isoformat()),
+                ),
+                partitions,
+            )
+            for run_start, run_end in runs
+        ]
+        computed_results = iter(runner.run([q for queries in run_queries for q in queries]))
+        for (run_start, run_end), queries in zip(runs, run_queries):
+            computed = pd.concat([next(computed_results) for _ in queries], ignore_index=True)
+            computed = computed[computed["day"].between(run_start, run_end)]
+            run_days = [day for day in to_compute if run_start <= day <= run_end]
+            loaded.update(split_by_day(computed, run_days))
+
+        logger.info(
+            "Banner links media day slices: cached=%s, rollup=%s, computed=%s",
+            len(slices),
+            len(ready),
+            len(to_compute),
+        )
+        cache.put_many(loaded)
+        slices.update(loaded)
+
+    return [slices[day] for day in days], live
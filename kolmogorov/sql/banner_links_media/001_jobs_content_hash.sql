@@ -0,0 +1,8 @@
+-- Хэш файла у задачи: повтор файла, который ещё обрабатывается, получает тикет этой задачи
+alter table analytics.banner_links_media_jobs
+    add column if not exists content_hash text;
+
+-- Не больше одной выполняющейся задачи на файл; на индекс опирается on conflict в BannerLinksMediaJobs.create
+create unique index if not exists banner_links_media_jobs_running_content_hash_idx
+    on analytics.banner_links_media_jobs (content_hash)
+    where status = 'running';
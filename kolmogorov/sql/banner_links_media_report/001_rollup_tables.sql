@@ -0,0 +1,52 @@
+-- Таблицы и представления, которые ведут плановые обновления из src/banner_links_media_report/rollup.py
+
+-- Дневной агрегат отчёта: множества id, чтобы distinct при объединении дней оставался точным
+create table if not exists analytics.banner_links_media_daily (
+    day date not null,
+    banner_id bigint not null,
+    clicks bigint not null,
+    reg_ids bigint[] not null,
+    active_reg_ids bigint[] not null,
+    active_keys text[] not null,
+    primary key (day, banner_id)
+);
+
+-- Дни, пересчитанные в агрегате: день без строк в banner_links_media_daily готов, если он есть здесь
+create table if not exists analytics.banner_links_media_daily_state (
+    day date primary key,
+    time_refreshed timestamp not null
+);
+
+-- Создаётся заполненной: refresh ... concurrently не работает с незаполненным представлением,
+-- а уникальный индекс ему обязателен
+create materialized view if not exists analytics.banner_links_media_excluded_users as
+    select user_id from analytics.excluded_course_students
+    union
+    select user_id from stat.excluded_users;
+create unique index if not exists banner_links_media_excluded_users_user_id_idx
+    on analytics.banner_links_media_excluded_users (user_id);
+
+-- Первые переходы по баннерам в порядке времени, не больше FIRST_CLICKS_STORED
+create table if not exists analytics.banner_first_clicks (
+    banner_id bigint primary key,
+    first_clicks timestamp[] not null,
+    time_updated timestamp not null
+);
+
+-- Водяной знак дополнения banner_first_clicks, одна строка с id = 1
+create table if not exists analytics.banner_first_clicks_state (
+    id int primary key,
+    watermark timestamp
+);
+
+-- Разобранные описания старых баннеров из noopolis.metrics_banner
+create table if not exists analytics.banner_links_media_legacy (
+    banner_id bigint primary key,
+    link text,
+    title text,
+    publication_type text,
+    channel text,
+    partner text,
+    is_outer boolean,
+    time_created timestamp
+);
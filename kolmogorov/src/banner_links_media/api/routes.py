@@ -1,13 +1,39 @@
 import json
 import logging
+import os
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import Any
 
 import pandas as pd
-from fastapi import APIRouter, Request, status
+from fastapi import APIRouter, File, Request, UploadFile, status
 from fastapi.responses import JSONResponse
 
-from lib.skill_executions.banner_links_media.generation import generate_link
-from lib.skill_executions.banner_links_media.repo import AnalyticsBannerLinks
-from lib.skill_executions.banner_links_media.types import EnumSkillError, ErrorCode
+from lib.data_source import AnalyticsDB
+from lib.skill_executions.banner_links_media.generation import (
+    generate_link,
+    needs_short_link,
+    shorten_links,
+)
+from lib.skill_executions.banner_links_media.repo import (
+    AnalyticsBannerLinks,
+    BannerLinksMediaCheckpoints,
+    BannerLinksMediaJobs,
+    BannerLinksMediaResults,
+)
+from lib.skill_executions.banner_links_media.types import (
+    BannerKey,
+    BannerLinkRecord,
+    EnumSkillError,
+    ErrorCode,
+    JobStatus,
+    RowCheckpoint,
+)
+from lib.skill_executions.banner_links_media.upload import is_gzip_upload, read_upload, records_hash
 from lib.skill_executions.banner_links_media.validation import validation
 from src.skill_executions.repo import SkillExecutionsRepo
 
@@ -15,11 +41,62 @@ logger = logging.getLogger(__name__)
 
 banner_link_media_router = APIRouter()
 
+PROGRESS_STEP = 50
 
-@banner_link_media_router.post("/bannerLinksMedia")
-def banner_links_media(file: str, request: Request) -> JSONResponse:
-    kolmogorov_repo = SkillExecutionsRepo(request.app.state.db_kolmogorov)
+# Сколько секунд повторная отправка того же файла получает сохранённый результат; 0 — без дедупликации
+DEDUP_WINDOW_SECONDS = int(os.getenv("BANNER_LINKS_MEDIA_DEDUP_WINDOW_SECONDS", str(24 * 60 * 60)))
+
+# Асинхронные задачи выполняются в своём пуле, а не в пуле потоков обработчиков API
+JOB_MAX_WORKERS = int(os.getenv("BANNER_LINKS_MEDIA_JOB_WORKERS", "2"))
+JOB_HEARTBEAT_SECONDS = 30
+# Задача без отметок дольше этого срока потеряна (например, процесс перезапустили) и считается упавшей
+JOB_STALE_SECONDS = 10 * JOB_HEARTBEAT_SECONDS
+
+_job_executor = ThreadPoolExecutor(max_workers=JOB_MAX_WORKERS, thread_name_prefix="banner-links-job")
+
+
+class _JobHeartbeat:
+    """Раз в JOB_HEARTBEAT_SECONDS отмечает живыми задачи процесса — и выполняемые, и ждущие в очереди пула."""
+
+    def __init__(self) -> None:
+        self._tickets: dict[str, BannerLinksMediaJobs] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
 
+    def add(self, ticket: str, jobs: BannerLinksMediaJobs) -> None:
+        with self._lock:
+            self._tickets[ticket] = jobs
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="banner-links-job-heartbeat", daemon=True)
+                self._thread.start()
+
+    def remove(self, ticket: str) -> None:
+        with self._lock:
+            self._tickets.pop(ticket, None)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(JOB_HEARTBEAT_SECONDS)
+            with self._lock:
+                tickets = list(self._tickets.items())
+            for ticket, jobs in tickets:
+                try:
+                    jobs.touch(ticket)
+                except Exception as e:
+                    logger.warning("Can't mark banner links job %s alive: %s", ticket, e)
+
+
+_job_heartbeat = _JobHeartbeat()
+
+
+@banner_link_media_router.post("/bannerLinksMedia")
+def banner_links_media(
+    file: str,
+    request: Request,
+    resume_id: int | None = None,
+    reuse_existing: bool = False,
+) -> JSONResponse:
+    # Совместимость со старыми клиентами: таблица приходит JSON-ом в query-параметре
     try:
         df = pd.DataFrame(json.loads(file)).dropna(how="all").fillna("")
 
@@ -28,56 +105,413 @@ def banner_links_media(file: str, request: Request) -> JSONResponse:
         logger.error("%s: %s", err.code.name, err)
         return err.to_response()
 
+    return _process_banner_links(df, request, resume_id, reuse_existing)
+
+
+@banner_link_media_router.post("/bannerLinksMedia/upload")
+def banner_links_media_upload(
+    request: Request,
+    file: UploadFile = File(...),  # noqa: B008
+    async_mode: bool = False,
+    resume_id: int | None = None,
+    reuse_existing: bool = False,
+) -> JSONResponse:
+    try:
+        df = read_upload(file.file, gzipped=is_gzip_upload(file.file, file.content_type))
+
+    except Exception as e:
+        err = EnumSkillError(ErrorCode.CANT_PARSE_FILE, str(e))
+        logger.error("%s: %s", err.code.name, err)
+        return err.to_response()
+
+    if async_mode:
+        return _start_banner_links_job(df, request, resume_id, reuse_existing)
+    return _process_banner_links(df, request, resume_id, reuse_existing)
+
+
+@banner_link_media_router.get("/bannerLinksMedia/result_{ticket}")
+def banner_links_media_result(ticket: str, request: Request) -> JSONResponse:
+    jobs = BannerLinksMediaJobs(request.app.state.db_analytics)
+    _fail_stale_job(jobs, ticket, SkillExecutionsRepo(request.app.state.db_kolmogorov))
+    job = jobs.get(ticket)
+    if job is None:
+        return JSONResponse(content={"error": "Unknown ticket"}, status_code=status.HTTP_404_NOT_FOUND)
+    return JSONResponse(content=job, status_code=status.HTTP_200_OK)
+
+
+def _fail_stale_job(jobs: BannerLinksMediaJobs, ticket: str, kolmogorov_repo: SkillExecutionsRepo) -> bool:
+    """Задачу, которую никто не выполняет, переводит в «failed»: сама она уже не завершится."""
+    interrupted = _job_error(EnumSkillError(ErrorCode.JOB_INTERRUPTED, ticket))
+    register_id = jobs.fail_stale(ticket, JOB_STALE_SECONDS, interrupted)
+    if register_id is None:
+        return False
+    logger.error("Banner links job %s stopped updating, marked as failed", ticket)
+    kolmogorov_repo.register_request_err(register_id)
+    return True
+
+
+def _job_accepted(ticket: str, rows_total: int) -> JSONResponse:
+    return JSONResponse(
+        content={"ticket": ticket, "rows_total": rows_total},
+        status_code=status.HTTP_202_ACCEPTED,
+    )
+
+
+def _find_running_job(content_hash: str, rows_total: int, request: Request) -> JSONResponse | None:
+    """Тикет задачи, которая уже обрабатывает тот же файл: повтор ждёт её результат, а не запускает вторую."""
+    jobs = BannerLinksMediaJobs(request.app.state.db_analytics)
+    try:
+        ticket = jobs.find_running(content_hash)
+        if ticket is None or _fail_stale_job(jobs, ticket, SkillExecutionsRepo(request.app.state.db_kolmogorov)):
+            return None
+    except Exception as e:
+        logger.warning("Can't look up running banner links job %s: %s", content_hash, e)
+        return None
+    logger.info("Banner links request %s repeats a running one, returning its ticket %s", content_hash, ticket)
+    return _job_accepted(ticket, rows_total)
+
+
+def _create_job(
+    jobs: BannerLinksMediaJobs,
+    kolmogorov_repo: SkillExecutionsRepo,
+    register_id: int,
+    content_hash: str,
+    rows_total: int,
+) -> tuple[str, JSONResponse | None]:
+    """Создаёт задачу под запрос; если тот же файл успели запустить параллельно, отдаёт тикет той задачи.
+
+    Во втором случае, как и при сбое создания, регистрация этого запроса закрывается ошибкой:
+    выполнять её никто не будет. Ответ возвращается вместо запуска задачи.
+    """
+    ticket = str(uuid.uuid4())
+    try:
+        running_ticket = jobs.create(ticket, register_id, rows_total, content_hash)
+    except Exception as e:
+        return ticket, _fail_job_start(kolmogorov_repo, register_id, EnumSkillError(ErrorCode.JOB_START_FAILED, str(e)))
+    if running_ticket == ticket:
+        return ticket, None
+    kolmogorov_repo.register_request_err(register_id)
+    logger.info("Banner links request %s repeats running job %s, returning its ticket", register_id, running_ticket)
+    return running_ticket, _job_accepted(running_ticket, rows_total)
+
+
+def _fail_job_start(kolmogorov_repo: SkillExecutionsRepo, register_id: int, error: EnumSkillError) -> JSONResponse:
+    kolmogorov_repo.register_request_err(register_id)
+    logger.error("%s: %s", error.code.name, error)
+    return error.to_response(register_id)
+
+
+def _register_request(
+    kolmogorov_repo: SkillExecutionsRepo,
+    db_analytics: AnalyticsDB,
+    df: pd.DataFrame,
+    content_hash: str,
+    resume_id: int | None,
+) -> int:
+    """Регистрирует запрос; повтор упавшего запроса с тем же файлом продолжает его же выполнение.
+
+    resume_id другого файла отклоняется. Если по resume_id нет ни одного чекпоинта, продолжать нечего,
+    и запрос регистрируется заново, чтобы не отметить успешным чужое выполнение.
+    """
+    if resume_id is not None:
+        try:
+            resumed_hash = BannerLinksMediaCheckpoints(db_analytics).get_content_hash(resume_id)
+        except Exception as e:
+            logger.warning("Can't read checkpoints of banner links request %s: %s", resume_id, e)
+            resumed_hash = None
+        if resumed_hash is not None and resumed_hash != content_hash:
+            raise EnumSkillError(ErrorCode.RESUME_MISMATCH, resume_id)
+        if resumed_hash is not None:
+            return resume_id
+        logger.info("Banner links request %s has no checkpoints, registering a new one", resume_id)
+
     data = {"records": df.to_dict(orient="records")}
-    register_id = kolmogorov_repo.register_running_request("BannerLinksMediaReport", data)
-    banner_repo = AnalyticsBannerLinks(request.app.state.db_analytics)
+    return kolmogorov_repo.register_running_request("BannerLinksMediaReport", data)  # type: ignore[no-any-return]
+
+
+def _find_previous_result(content_hash: str, db_analytics: AnalyticsDB) -> JSONResponse | None:
+    if DEDUP_WINDOW_SECONDS <= 0:
+        return None
+    # Недоступная таблица результатов — просто промах, запрос обрабатывается как обычно
+    try:
+        result = BannerLinksMediaResults(db_analytics).get(content_hash, DEDUP_WINDOW_SECONDS)
+    except Exception as e:
+        logger.warning("Can't read banner links result %s: %s", content_hash, e)
+        return None
+    if result is None:
+        return None
+    logger.info("Banner links request %s repeats a finished one, returning stored result", content_hash)
+    return JSONResponse(content={"file": result}, status_code=status.HTTP_200_OK)
+
+
+def _save_result(content_hash: str, register_id: int, result: list[dict[str, Any]], db_analytics: AnalyticsDB) -> None:
+    # Результат уже получен, поэтому сбой записи только отключает дедупликацию для этого файла
+    try:
+        BannerLinksMediaResults(db_analytics).save(content_hash, register_id, result)
+    except Exception as e:
+        logger.warning("Can't save banner links result %s: %s", content_hash, e)
+
+
+def _process_banner_links(
+    df: pd.DataFrame,
+    request: Request,
+    resume_id: int | None = None,
+    reuse_existing: bool = False,
+) -> JSONResponse:
+    content_hash = records_hash(df)
+    previous = _find_previous_result(content_hash, request.app.state.db_analytics)
+    if previous is None:
+        previous = _find_running_job(content_hash, len(df), request)
+    if previous is not None:
+        return previous
+
+    kolmogorov_repo = SkillExecutionsRepo(request.app.state.db_kolmogorov)
+    try:
+        register_id = _register_request(kolmogorov_repo, request.app.state.db_analytics, df, content_hash, resume_id)
+    except EnumSkillError as error:
+        logger.error("%s: %s", error.code.name, error)
+        return error.to_response()
 
     # Валидация данных
     error = validation(df)
     if error:
         kolmogorov_repo.register_request_err(register_id)
-        logger.error("%s: %s", err.code.name, err)
+        logger.error("%s: %s", error.code.name, error)
         return error.to_response()
 
+    # Синхронный запрос тоже ведёт задачу, чтобы повтор того же файла во время обработки получил её тикет
+    jobs = BannerLinksMediaJobs(request.app.state.db_analytics)
+    ticket, response = _create_job(jobs, kolmogorov_repo, register_id, content_hash, len(df))
+    if response is not None:
+        return response
+
+    _job_heartbeat.add(ticket, jobs)
+    try:
+        error = _run_banner_links_job(
+            df,
+            ticket,
+            register_id,
+            content_hash,
+            kolmogorov_repo,
+            jobs,
+            request.app.state.db_analytics,
+            reuse_existing,
+        )
+    finally:
+        _job_heartbeat.remove(ticket)
+    if error:
+        return error.to_response(register_id)
+    return JSONResponse(content={"file": df.to_dict(orient="records")}, status_code=status.HTTP_200_OK)
+
+
+def _start_banner_links_job(
+    df: pd.DataFrame,
+    request: Request,
+    resume_id: int | None = None,
+    reuse_existing: bool = False,
+) -> JSONResponse:
+    # Повтор уже выполненного файла отдаётся сразу, без тикета, а выполняющегося — тикетом его задачи
+    content_hash = records_hash(df)
+    previous = _find_previous_result(content_hash, request.app.state.db_analytics)
+    if previous is None:
+        previous = _find_running_job(content_hash, len(df), request)
+    if previous is not None:
+        return previous
+
+    kolmogorov_repo = SkillExecutionsRepo(request.app.state.db_kolmogorov)
+    try:
+        register_id = _register_request(kolmogorov_repo, request.app.state.db_analytics, df, content_hash, resume_id)
+    except EnumSkillError as error:
+        logger.error("%s: %s", error.code.name, error)
+        return error.to_response()
+
+    # Валидация быстрая, поэтому ошибки в данных возвращаем сразу, без тикета
+    error = validation(df)
+    if error:
+        kolmogorov_repo.register_request_err(register_id)
+        logger.error("%s: %s", error.code.name, error)
+        return error.to_response()
+
+    jobs = BannerLinksMediaJobs(request.app.state.db_analytics)
+    ticket, response = _create_job(jobs, kolmogorov_repo, register_id, content_hash, len(df))
+    if response is not None:
+        return response
+
+    _job_heartbeat.add(ticket, jobs)
+    try:
+        future = _job_executor.submit(
+            _run_banner_links_job,
+            df,
+            ticket,
+            register_id,
+            content_hash,
+            kolmogorov_repo,
+            jobs,
+            request.app.state.db_analytics,
+            reuse_existing,
+        )
+    except Exception as e:
+        # Задача уже создана: без перевода в «failed» её тикет так и висел бы выполняющимся
+        _job_heartbeat.remove(ticket)
+        error = EnumSkillError(ErrorCode.JOB_START_FAILED, str(e))
+        jobs.finish(ticket, JobStatus.FAILED, error={**_job_error(error), "register_id": register_id})
+        return _fail_job_start(kolmogorov_repo, register_id, error)
+    future.add_done_callback(lambda _: _job_heartbeat.remove(ticket))
+    return _job_accepted(ticket, len(df))
+
+
+def _run_banner_links_job(
+    df: pd.DataFrame,
+    ticket: str,
+    register_id: int,
+    content_hash: str,
+    kolmogorov_repo: SkillExecutionsRepo,
+    jobs: BannerLinksMediaJobs,
+    db_analytics: AnalyticsDB,
+    reuse_existing: bool = False,
+) -> EnumSkillError | None:
+    """Выполняет задачу и записывает её итог; при успехе в df появляется колонка banner_links."""
+    try:
+        error = _generate_banner_links(
+            df, db_analytics, register_id, content_hash, lambda done: jobs.update_progress(ticket, done), reuse_existing
+        )
+    except Exception as e:
+        logger.exception("Banner links job failed, ticket=%s", ticket)
+        error = EnumSkillError(ErrorCode.BANNER_GENERATION, str(e))
+
+    if error:
+        kolmogorov_repo.register_request_err(register_id)
+        jobs.finish(ticket, JobStatus.FAILED, error={**_job_error(error), "register_id": register_id})
+        return error
+
+    kolmogorov_repo.register_request_succeed(register_id, df["banner_links"].to_string())
+    result = df.to_dict(orient="records")
+    _save_result(content_hash, register_id, result, db_analytics)
+    jobs.finish(ticket, JobStatus.SUCCEED, result=result)
+    return None
+
+
+def _job_error(error: EnumSkillError) -> dict[str, Any]:
+    return {
+        "error_code": error.code.name,
+        "error": error.code.client_error,
+        "error_reason": str(error),
+    }
+
+
+def _banner_key(line: pd.Series) -> BannerKey:  # type: ignore[type-arg]
+    return (
+        str(line["link"]).strip(),
+        str(line["channel"]).strip(),
+        str(line["partner"]).strip(),
+        str(line["publication_type"]).strip(),
+    )
+
+
+def _generate_banner_links(
+    df: pd.DataFrame,
+    db_analytics: AnalyticsDB,
+    register_id: int,
+    content_hash: str,
+    on_progress: Callable[[int], None] | None = None,
+    reuse_existing: bool = False,
+) -> EnumSkillError | None:
+    """Создаёт баннеры, сокращает ссылки и пишет строки в analytics.banner_links_media.
+
+    Каждая готовая строка сохраняется в чекпоинт register_id, поэтому повтор запроса
+    не создаёт баннеры и не сокращает ссылки заново для уже обработанных строк.
+    С reuse_existing строки с уже известным ключом (link, channel, partner, publication_type)
+    получают существующий баннер, а повторы ключа внутри файла — баннер первой такой строки.
+    При успехе добавляет в df колонку banner_links.
+    """
+    banner_repo = AnalyticsBannerLinks(db_analytics)
+    checkpoints_repo = BannerLinksMediaCheckpoints(db_analytics)
+
+    # owners[i] — строка, чей баннер получает строка i; без reuse_existing каждая строка сама себе владелец
+    keys = [_banner_key(line) for _, line in df.iterrows()]
+    owners = list(range(len(df)))
+    existing: dict[BannerKey, tuple[int, str]] = {}
+    if reuse_existing:
+        first_row: dict[BannerKey, int] = {}
+        owners = [first_row.setdefault(key, i) for i, key in enumerate(keys)]
+        existing = banner_repo.find_existing(list(first_row))
+        logger.info("Banner links reuse: rows=%s, unique=%s, existing=%s", len(df), len(first_row), len(existing))
+    to_generate = [i for i, owner in enumerate(owners) if i == owner and keys[i] not in existing]
+
+    # Чекпоинт годится, только если строка с тем же номером ведёт на ту же ссылку
+    links = [str(link) for link in df["link"]]
+    checkpoints = {
+        row: checkpoint
+        for row, checkpoint in checkpoints_repo.get(register_id, content_hash).items()
+        if row < len(links) and checkpoint.link == links[row]
+    }
+    if checkpoints:
+        logger.info("Banner links request %s resumed: %s/%s rows done", register_id, len(checkpoints), len(df))
+
     # Генерация баннерных ссылок
     is_test = False
-    banner_links = []
 
-    for _, line in df.iterrows():
-        val, error = generate_link(line, is_test)
+    pending = [i for i in to_generate if i not in checkpoints]
+    for done, i in enumerate(pending, start=len(to_generate) - len(pending) + 1):
+        val, error = generate_link(df.iloc[i], is_test, shorten=False)
 
-        if val == status.HTTP_500_INTERNAL_SERVER_ERROR:
-            kolmogorov_repo.register_request_err(register_id)
+        if val is None:
             logger.error("%s: %s", ErrorCode.BANNER_GENERATION.name, error)
-            return EnumSkillError(ErrorCode.BANNER_GENERATION, str(error)).to_response()
+            return EnumSkillError(ErrorCode.BANNER_GENERATION, str(error))
 
-        banner_id, banner_link = val, str(error)
+        # Чекпоинт сразу после каждого баннера
+        checkpoints[i] = RowCheckpoint(row=i, link=links[i], banner_id=val, banner_link=str(error))
+        checkpoints_repo.save(register_id, content_hash, [checkpoints[i]])
+        if on_progress is not None and done % PROGRESS_STEP == 0:
+            on_progress(done)
 
-        # Обновление таблицы
-        try:
-            is_outer = str(line["partner_type"]).strip() == "+"
-            is_technical = str(line["is_technical"]).lower().strip() == "да"
-            is_deleted = is_test
-
-            banner_repo.update_db(
-                banner_id=banner_id,
-                banner_link=banner_link,
-                title=line["description"].strip(),
-                publication_type=line["publication_type"].strip(),
-                is_outer=is_outer,
-                channel=line["channel"].strip(),
-                link=line["link"].strip(),
-                is_technical=is_technical,
-                partner=line["partner"].strip(),
-                is_deleted=is_deleted,
-            )
-        except Exception as e:
-            kolmogorov_repo.register_request_err(register_id)
-            logger.error("Can't update banner link: %s", str(e))
-            return EnumSkillError(ErrorCode.DB_UPDATE_FAILED, str(e)).to_response()
+    # Короткие ссылки — одним параллельным батчем, только для строк, где их ещё нет
+    if not is_test:
+        to_shorten = [i for i in to_generate if needs_short_link(df.iloc[i]) and checkpoints[i].short_link is None]
+        shortened = shorten_links([checkpoints[i].banner_link for i in to_shorten])
 
-        banner_links.append(banner_link)
+        shortened_rows = []
+        for i, (short_link, _) in zip(to_shorten, shortened):
+            if short_link is not None:
+                checkpoints[i] = replace(checkpoints[i], short_link=str(short_link))
+                shortened_rows.append(checkpoints[i])
+        checkpoints_repo.save(register_id, content_hash, shortened_rows)
 
-    df["banner_links"] = banner_links
-    kolmogorov_repo.register_request_succeed(register_id, df["banner_links"].to_string())
-    return JSONResponse(content={"file": df.to_dict(orient="records")}, status_code=status.HTTP_200_OK)
+        failed = [(i, error) for i, (_, error) in zip(to_shorten, shortened) if error is not None]
+        if failed:
+            for i, error in failed:
+                logger.error("%s: row=%s: %s", error.code.name, i, error)
+            return failed[0][1]
+
+    results = {
+        i: (checkpoints[i].banner_id, checkpoints[i].short_link or checkpoints[i].banner_link) for i in to_generate
+    }
+    results.update({owners[i]: existing[keys[i]] for i in range(len(df)) if keys[i] in existing})
+
+    records = [
+        BannerLinkRecord(
+            banner_id=results[i][0],
+            banner_link=results[i][1],
+            title=line["description"].strip(),
+            publication_type=line["publication_type"].strip(),
+            is_outer=str(line["partner_type"]).strip() == "+",
+            channel=line["channel"].strip(),
+            link=line["link"].strip(),
+            is_technical=str(line["is_technical"]).lower().strip() == "да",
+            partner=line["partner"].strip(),
+            is_deleted=is_test,
+        )
+        for i, line in ((i, df.iloc[i]) for i in to_generate)
+    ]
+
+    # Обновление таблицы
+    try:
+        banner_repo.insert_many(records)
+    except Exception as e:
+        logger.error("Can't update banner link: %s", str(e))
+        return EnumSkillError(ErrorCode.DB_UPDATE_FAILED, str(e))
+
+    if on_progress is not None:
+        on_progress(len(df))
+    df["banner_links"] = [results[owner][1] for owner in owners]
+    return None
@@ -0,0 +1,97 @@
+import logging
+import os
+from datetime import date, timedelta
+from typing import Final
+
+from lib.data_source import AnalyticsDB
+from lib.reports.banner_links_media_report.repo import AnalyticsLegacyBanners, ReportBannerLinksMediaRepo
+from lib.reports.banner_links_media_report.scheduler import JobScheduler, ScheduledJob
+from lib.time import TimeRange, now_time_msk, parse_time
+
+logger = logging.getLogger(__name__)
+
+# Активации и исключённые пользователи меняются задним числом, поэтому хвост пересчитываем
+ROLLUP_REFRESH_DAYS: Final = 30
+
+
+def refresh_banner_links_media_daily(
+    db_analytics: AnalyticsDB,
+    from_date: date | None = None,
+    refresh_days: int = ROLLUP_REFRESH_DAYS,
+) -> None:
+    """Плановое обновление analytics.banner_links_media_daily по закрытым дням.
+
+    Без from_date пересчитывает последние refresh_days дней; с from_date — бэкфилл от этой даты.
+    Каждый день пишется отдельной транзакцией, так что прерванный бэкфилл можно продолжить.
+    """
+    repo = ReportBannerLinksMediaRepo()
+    to_date = now_time_msk().date() - timedelta(days=1)
+    day = from_date or to_date - timedelta(days=refresh_days - 1)
+
+    while day <= to_date:
+        next_day = day + timedelta(days=1)
+        tr = TimeRange(from_in=parse_time(day.isoformat()), to_in=parse_time(next_day.isoformat()))
+        with db_analytics.get_connection() as conn:
+            try:
+                with conn.cursor() as cursor:
+                    for q in repo.get_refresh_daily_q(day, day, tr):
+                        cursor.execute(q)
+            except Exception:
+                conn.rollback()
+                logger.exception("Failed to refresh banner links media rollup for day=%s", day)
+                raise
+            conn.commit()
+        logger.info("Banner links media rollup refreshed for day=%s", day)
+        day = next_day
+
+
+def refresh_excluded_users(db_analytics: AnalyticsDB) -> None:
+    """Плановое обновление материализованного списка исключённых пользователей для отчёта."""
+    repo = ReportBannerLinksMediaRepo()
+    with db_analytics.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(repo.get_refresh_excluded_q())
+        conn.commit()
+    logger.info("Banner links media excluded users refreshed")
+
+
+def refresh_first_clicks(db_analytics: AnalyticsDB) -> None:
+    """Плановый пересчёт первых переходов по задетым баннерам; первый запуск заполняет таблицу с нуля."""
+    repo = ReportBannerLinksMediaRepo()
+    with db_analytics.get_connection() as conn:
+        try:
+            with conn.cursor() as cursor:
+                for q in repo.get_refresh_first_clicks_q():
+                    cursor.execute(q)
+        except Exception:
+            conn.rollback()
+            logger.exception("Failed to refresh banner first clicks")
+            raise
+        conn.commit()
+    logger.info("Banner first clicks refreshed")
+
+
+def sync_legacy_banners(db_analytics: AnalyticsDB) -> None:
+    """Плановая синхронизация разобранных описаний старых баннеров; первый запуск делает бэкфилл."""
+    synced = AnalyticsLegacyBanners(db_analytics).sync()
+    logger.info("Legacy banners synced: %s", synced)
+
+
+# Исключённые пользователи обновляются раньше дневного агрегата, который их уже вычитает
+ROLLUP_JOBS: Final = [
+    ScheduledJob("excluded_users", 60 * 60, refresh_excluded_users),
+    ScheduledJob("legacy_banners", 60 * 60, sync_legacy_banners),
+    ScheduledJob("first_clicks", 10 * 60, refresh_first_clicks),
+    ScheduledJob("daily", 6 * 60 * 60, refresh_banner_links_media_daily),
+]
+
+# 0 отключает плановые обновления в процессе, например если их запускает отдельный воркер
+ROLLUP_SCHEDULER_ENABLED = os.getenv("BANNER_LINKS_MEDIA_ROLLUP_SCHEDULER", "1") != "0"
+
+rollup_scheduler: Final = JobScheduler(ROLLUP_JOBS)
+
+
+def start_rollup_scheduler(db_analytics: AnalyticsDB) -> None:
+    """Запускает плановые обновления отчёта в этом процессе, если они не отключены."""
+    if ROLLUP_SCHEDULER_ENABLED:
+        rollup_scheduler.start(db_analytics)
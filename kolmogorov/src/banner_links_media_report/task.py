@@ -1,15 +1,39 @@
 import logging
 import os
 import tempfile
+from collections.abc import Iterable
+from datetime import datetime, timedelta
+from itertools import chain
 
 import pandas as pd
 
 from lib.data_source import AnalyticsDB
 from lib.queries.repo import AnalyticsRepo
-from lib.reports.banner_links_media_report.parsing import table_parse
-from lib.reports.banner_links_media_report.repo import ReportBannerLinksMediaRepo
+from lib.reports.banner_links_media_report.export import (
+    EXPORT_CHUNK_ROWS,
+    TOTAL_ROW_ID,
+    ReportFormat,
+    iter_table_chunks,
+    write_report,
+)
+from lib.reports.banner_links_media_report.parallel import ParallelQueryRunner
+from lib.reports.banner_links_media_report.repo import (
+    FACT_PUBLICATION_CLICK,
+    FIRST_CLICKS_STORED,
+    ReportBannerLinksMediaRepo,
+)
+from lib.reports.banner_links_media_report.singleflight import SingleFlight
+from lib.reports.banner_links_media_report.slices import (
+    DAILY_COLUMNS,
+    combine_daily,
+    live_slice_cache,
+    load_daily_slices,
+    merge_slices,
+    refresh_activations,
+)
 from lib.reports.s3_file_storage import MinioBucketResultStorage
 from lib.time import TimeRange, now_time_msk, parse_time
+from src.banner_links_media_report.rollup import start_rollup_scheduler
 from src.data_source import KolmogorovDB
 from src.reports.api.models import BannerLinksMediaParameters, Parameters
 from src.reports.base.register import TaskRegister
@@ -18,6 +42,39 @@ from src.reports.base.types import ErrorReason, ParametersInfo, ReportsType, Tas
 
 logger = logging.getLogger(__name__)
 
+# Число hash-бакетов banner_id, на которые делится расчёт по сырым таблицам; 1 — без деления
+REPORT_PARTITIONS = int(os.getenv("BANNER_LINKS_MEDIA_REPORT_PARTITIONS", "1"))
+
+report_flights: SingleFlight[TaskResult] = SingleFlight()
+
+# Версия в пути отделяет отчёты, где to_date входит целиком, от сохранённых раньше без этого дня:
+# те по тем же параметрам не отдаются, а строятся заново
+REPORT_STORAGE_PATH = "rob-analytics/reports/banner_links_media/v2"
+
+# Окно привязки регистрации к переходу: при дочитывании дельты переходы берутся с таким запасом
+REGISTRATION_WINDOW = timedelta(minutes=30)
+
+REPORT_COLUMNS = [
+    "id",
+    "link",
+    "channel",
+    "partner",
+    "partner_type",
+    "publication_type",
+    "fact_publication_date",
+    "title",
+    "clicks",
+    "regs",
+    "active",
+]
+
+
+def _report_range(parameters: BannerLinksMediaParameters) -> tuple[datetime, datetime]:
+    """Границы отчёта [from_date 00:00, to_date + 1 день 00:00): to_date входит в отчёт целиком на всех путях."""
+    from_dt = parse_time(parameters.from_date)
+    to_day = parse_time(parameters.to_date).date()  # type: ignore[union-attr]
+    return from_dt, parse_time((to_day + timedelta(days=1)).isoformat())  # type: ignore[return-value]
+
 
 class ReportBannerLinksMedia(Task):
     def check_parameters(
@@ -29,7 +86,10 @@ class ReportBannerLinksMedia(Task):
             return False
 
         try:
-            TimeRange(from_in=parse_time(parameters.from_date), to_in=parse_time(parameters.to_date))
+            from_dt, end_dt = _report_range(parameters)
+            TimeRange(from_in=from_dt, to_in=end_dt)
+            self._get_report_format(parameters)
+            self._get_nth_click(parameters)
         except Exception:
             return False
 
@@ -41,8 +101,12 @@ class ReportBannerLinksMedia(Task):
         db_analytics: AnalyticsDB,
         db_kolmogorov: KolmogorovDB,
     ) -> ParametersInfo | None:
+        # Процесс, который принимает запросы отчёта, сам ведёт его агрегаты
+        start_rollup_scheduler(db_analytics)
         if not isinstance(parameters, BannerLinksMediaParameters):
             return None
+        if not self.check_parameters(parameters, db_analytics):
+            return None
 
         report_path = self._get_report_path(parameters, db_kolmogorov)
 
@@ -66,11 +130,115 @@ class ReportBannerLinksMedia(Task):
         if not last_report:
             return None
 
+        # Формат входит в параметры, но старые отчёты сохранены без него — сверяем и расширение файла
+        extension = ReportBannerLinksMedia._get_report_format(parameters).extension
         for report_path, _ in last_report.items():
-            return report_path
+            if REPORT_STORAGE_PATH in report_path and report_path.endswith(extension):
+                return report_path
 
         return None
 
+    @staticmethod
+    def _get_report_format(parameters: BannerLinksMediaParameters) -> ReportFormat:
+        return ReportFormat(getattr(parameters, "output_format", None) or ReportFormat.CSV.value)
+
+    @staticmethod
+    def _get_nth_click(parameters: BannerLinksMediaParameters) -> int:
+        """Номер перехода, который считается фактической датой публикации: от 1 до FIRST_CLICKS_STORED."""
+        nth_click = int(getattr(parameters, "nth_click", None) or FACT_PUBLICATION_CLICK)
+        if not 1 <= nth_click <= FIRST_CLICKS_STORED:
+            raise ValueError(f"nth_click must be between 1 and {FIRST_CLICKS_STORED}, got {nth_click}")
+        return nth_click
+
+    def _load_report(
+        self,
+        db_analytics: AnalyticsDB,
+        repo: ReportBannerLinksMediaRepo,
+        parameters: BannerLinksMediaParameters,
+        tr: TimeRange,
+    ) -> Iterable[pd.DataFrame]:
+        """Строки по баннерам и строка «Итог» частями в порядке выгрузки.
+
+        Диапазон без закрытых дней считается одним запросом и читается серверным курсором,
+        так что части пишутся в файл, не собираясь в памяти.
+
+        Иначе таблица собирается в памяти. Закрытые дни берутся из дневных срезов, так что пересекающиеся
+        диапазоны пересчитывают только недостающие дни. Текущий день берётся из live_slice_cache:
+        свежий срез отдаётся как есть, у устаревшего дочитываются только переходы после водяного знака,
+        а активации уже учтённых регистраций пересчитываются.
+        """
+        runner = ParallelQueryRunner(db_analytics)
+        from_dt, end_dt = _report_range(parameters)
+        to_date = end_dt.date() - timedelta(days=1)
+        today = now_time_msk().date()
+        closed_to = min(to_date, today - timedelta(days=1))
+        from_date = from_dt.date()
+
+        nth_click = self._get_nth_click(parameters)
+        if closed_to < from_date:
+            return runner.iter_chunks(repo.get_combined_export_q(tr, nth_click), EXPORT_CHUNK_ROWS)
+
+        live_key = None
+        cached = None
+        live_queries: list[str] = []
+        activations_q = None
+        if to_date >= today:
+            today_start = parse_time(today.isoformat())
+            live_from = max(from_dt, today_start)  # type: ignore[type-var]
+            live_key = (live_from, end_dt)
+            # Живые запросы читают переходы только до водяного знака: более поздние достанутся следующей дельте,
+            # а не попадут в кэш и ещё раз в дельту с count_from=watermark
+            watermark = min(parse_time(now_time_msk().strftime("%Y-%m-%d %H:%M:%S")), end_dt)  # type: ignore[type-var]
+            cached = live_slice_cache.get(live_key)  # type: ignore[arg-type]
+            if cached is None:
+                live_queries = repo.get_daily_partitioned_q(
+                    TimeRange(from_in=live_from, to_in=watermark), REPORT_PARTITIONS
+                )
+            elif not live_slice_cache.is_fresh(cached):
+                # Регистрация после водяного знака может относиться к переходу до него, поэтому
+                # переходы читаются с запасом в окно привязки, а считаются только новые
+                delta_from = max(live_from, cached.watermark - REGISTRATION_WINDOW)
+                live_queries = repo.get_daily_partitioned_q(
+                    TimeRange(from_in=delta_from, to_in=watermark), REPORT_PARTITIONS, count_from=cached.watermark
+                )
+                # Регистрации из среза могли пройти модуль уже после его расчёта
+                cached_reg_ids = sorted(set(chain.from_iterable(cached.frame["reg_ids"])))
+                if cached_reg_ids:
+                    activations_q = repo.get_activations_q(cached_reg_ids)
+
+        frames, live = load_daily_slices(
+            runner,
+            repo,
+            from_date,
+            closed_to,
+            live_queries + ([activations_q] if activations_q else []),
+            REPORT_PARTITIONS,
+        )
+        if live_key is not None:
+            if cached is None or live_queries:
+                previous = []
+                if cached is not None:
+                    # Результат activations_q идёт последним
+                    previous = [refresh_activations(cached.frame, live.pop()) if activations_q else cached.frame]
+                live_frame = combine_daily(previous + [frame[DAILY_COLUMNS] for frame in live])
+                computed_at = cached.computed_at if cached is not None else None
+                live_slice_cache.put(live_key, watermark, live_frame, computed_at)  # type: ignore[arg-type]
+            else:
+                live_frame = cached.frame
+            logger.info(
+                "Banner links media live slice: %s",
+                "computed" if cached is None else "delta" if live_queries else "cached",
+            )
+            frames = frames + [live_frame]
+
+        per_banner, totals = merge_slices(pd.concat(frames, ignore_index=True))
+        banners = runner.run_one(repo.get_banners_q(per_banner["banner_id"].tolist(), nth_click))
+        table = banners.merge(per_banner, on="banner_id", how="left")
+        table[["clicks", "regs", "active"]] = table[["clicks", "regs", "active"]].fillna(0).astype(int)
+        table = table.rename(columns={"banner_id": "id"})[REPORT_COLUMNS]
+        total = pd.DataFrame([{"id": TOTAL_ROW_ID, **totals}], columns=REPORT_COLUMNS)
+        return iter_table_chunks(pd.concat([table, total], ignore_index=True))
+
     def call(
         self,
         cheops_repo: AnalyticsRepo,
@@ -78,52 +246,57 @@ class ReportBannerLinksMedia(Task):
         parameters: Parameters,
         minio_storage: MinioBucketResultStorage,
         bucket_name: str,
+        db_analytics: AnalyticsDB | None = None,
     ) -> TaskResult:
+        """Строит отчёт; запросы идут на собственных соединениях db_analytics, чтобы их можно было прервать."""
         if not isinstance(parameters, BannerLinksMediaParameters):
             return TaskResult(request_result=None, error_details=ErrorReason.PARAMETERSERROR.value)
+        if db_analytics is None:
+            logger.error("Banner links media report for ticket=%s needs db_analytics, got none", ticket)
+            return TaskResult(request_result=None, error_details=ErrorReason.CANTCALCULATE.value)
+        start_rollup_scheduler(db_analytics)
+        try:
+            report_format = self._get_report_format(parameters)
+            nth_click = self._get_nth_click(parameters)
+        except ValueError:
+            return TaskResult(request_result=None, error_details=ErrorReason.PARAMETERSERROR.value)
+
+        # Одинаковый отчёт, который уже строится для другого тикета, не считаем второй раз
+        key = (parameters.from_date, parameters.to_date, report_format, nth_click)
+        result, is_shared = report_flights.do(
+            key, lambda: self._build(db_analytics, ticket, parameters, minio_storage, bucket_name)
+        )
+        if is_shared:
+            logger.info("Banner links media report for ticket=%s reused an in-flight computation", ticket)
+        return result
 
-        tr = TimeRange(from_in=parse_time(parameters.from_date), to_in=parse_time(parameters.to_date))
+    def _build(
+        self,
+        db_analytics: AnalyticsDB,
+        ticket: Ticket,
+        parameters: BannerLinksMediaParameters,
+        minio_storage: MinioBucketResultStorage,
+        bucket_name: str,
+    ) -> TaskResult:
+        from_dt, end_dt = _report_range(parameters)
+        tr = TimeRange(from_in=from_dt, to_in=end_dt)
         repo = ReportBannerLinksMediaRepo()
+        report_format = self._get_report_format(parameters)
         with tempfile.TemporaryDirectory(suffix=f"{ticket}") as tempdir:
+            report_file = os.path.join(tempdir, f"report_{ticket}{report_format.extension}")
             try:
-                rows, cols, _ = cheops_repo.perform_q(repo.get_q(tr), [])
-                rows1, cols1, _ = cheops_repo.perform_q(repo.get_all_q(tr), [])
+                # Части из курсора пишутся по мере чтения, поэтому ошибка запроса может прийти и во время записи
+                write_report(self._load_report(db_analytics, repo, parameters, tr), report_file, report_format)
             except Exception as e:
                 logger.exception("Failed to generate banner links media report data for ticket=%s: %s", ticket, e)
                 return TaskResult(request_result=None, error_details=ErrorReason.CANTCALCULATE.value)
 
-            table = pd.DataFrame(rows, columns=cols)
-            table = table_parse(table)
-            table["fact_publication_date"] = table["fact_publication_date"].apply(
-                lambda x: parse_time(x).date().strftime("%d.%m.%Y") if pd.notna(x) else ""  # type: ignore[union-attr]
-            )
-            table = table.sort_values(by="fact_publication_date")
-            table = table.rename(
-                columns={
-                    "link": "Ссылка",
-                    "title": "Название публикации",
-                    "publication_type": "Тип публикации",
-                    "channel": "Канал",
-                    "partner_type": "Тип партнёра",
-                    "partner": "Партнёр",
-                    "fact_publication_date": "Фактическая дата публикации",
-                    "clicks": "Переходы",
-                    "regs": "Регистрации",
-                    "active": "Активные",
-                }
-            )
-            final_str = pd.DataFrame(rows1, columns=cols1)
-            table = pd.concat([table, final_str], ignore_index=True, axis=0)
-            table["Переходы -> Регистрации"] = round((table["Регистрации"] / table["Переходы"] * 100).fillna(0))
-            table["Регистрации -> Активные"] = round((table["Активные"] / table["Регистрации"] * 100).fillna(0))
             try:
-                report_file = os.path.join(tempdir, f"report_{ticket}.csv")
-                table.to_csv(report_file, index=False)
                 bucket_path, result_path = minio_storage.save_result(
                     bucket_name=bucket_name,
                     result_uuid=ticket,
                     result=report_file,
-                    report_path="rob-analytics/reports/banner_links_media",
+                    report_path=REPORT_STORAGE_PATH,
                 )
                 request_result = f"{bucket_path}/{result_path}"
                 return TaskResult(request_result=request_result, error_details=None)
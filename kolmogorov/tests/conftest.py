@@ -0,0 +1,86 @@
+import logging
+import os
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any, Final
+
+import pytest
+
+# Отдельная пустая база: тесты создают в ней схемы noopolis/analytics/stat и убирают их за собой
+TEST_DSN_ENV: Final = "BANNER_LINKS_MEDIA_TEST_DSN"
+# Тесты с маркером benchmark долгие и запускаются только с этой переменной;
+# замеры пишутся в лог, увидеть их можно с -o log_cli=true --log-cli-level=INFO
+BENCHMARKS_ENV: Final = "RUN_BENCHMARKS"
+
+benchmark_logger = logging.getLogger("benchmark")
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    config.addinivalue_line("markers", f"benchmark: замер производительности, запускается только с {BENCHMARKS_ENV}")
+
+
+def pytest_collection_modifyitems(config: pytest.Config, items: list[pytest.Item]) -> None:
+    if os.environ.get(BENCHMARKS_ENV):
+        return
+    skip = pytest.mark.skip(reason=f"{BENCHMARKS_ENV} is not set")
+    for item in items:
+        if item.get_closest_marker("benchmark"):
+            item.add_marker(skip)
+
+
+class _Stopwatch:
+    """Лучшее время по каждой метке среди замеров бенчмарка и итог в лог; inf — замер не уложился в таймаут."""
+
+    def __init__(self) -> None:
+        self.seconds: dict[str, float] = {}
+
+    @contextmanager
+    def measure(self, label: str) -> Iterator[None]:
+        # Замер, прерванный исключением, не записывается
+        started = time.perf_counter()
+        yield
+        self.seconds[label] = min(self.seconds.get(label, float("inf")), time.perf_counter() - started)
+
+    def report(self, title: str) -> None:
+        timings = ", ".join(
+            f"{label} {seconds:.2f}s" if seconds != float("inf") else f"{label} timed out"
+            for label, seconds in self.seconds.items()
+        )
+        benchmark_logger.info("%s: %s", title, timings)
+
+
+class _Session:
+    """Отдаёт новое соединение на каждый get_connection, как пул AnalyticsDB."""
+
+    def __init__(self, dsn: str) -> None:
+        self._dsn = dsn
+
+    @contextmanager
+    def get_connection(self) -> Iterator[Any]:
+        import psycopg2
+
+        conn = psycopg2.connect(self._dsn)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+@pytest.fixture
+def test_dsn() -> str:
+    dsn = os.environ.get(TEST_DSN_ENV)
+    if not dsn:
+        pytest.skip(f"{TEST_DSN_ENV} is not set")
+    pytest.importorskip("psycopg2")
+    return dsn
+
+
+@pytest.fixture
+def db_session(test_dsn: str) -> _Session:
+    return _Session(test_dsn)
+
+
+@pytest.fixture
+def stopwatch() -> _Stopwatch:
+    return _Stopwatch()
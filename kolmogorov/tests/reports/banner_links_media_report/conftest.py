@@ -0,0 +1,50 @@
+from collections.abc import Iterator
+from typing import Any
+
+import pytest
+
+from .db import BENCHMARK_CLICKS, REPORT_SCHEMAS, SCHEMA_DDL, fill_report_fixture
+
+
+@pytest.fixture
+def report_schema(test_dsn: str) -> Iterator[Any]:
+    """Курсор в транзакции с созданной схемой отчёта; всё откатывается после теста."""
+    import psycopg2
+
+    conn = psycopg2.connect(test_dsn)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(SCHEMA_DDL)
+            yield cursor
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+@pytest.fixture
+def report_db(report_schema: Any) -> Any:
+    fill_report_fixture(report_schema)
+    return report_schema
+
+
+@pytest.fixture
+def benchmark_report_db(report_schema: Any) -> Any:
+    fill_report_fixture(report_schema, clicks=BENCHMARK_CLICKS)
+    return report_schema
+
+
+@pytest.fixture
+def committed_report_db(db_session: Any) -> Iterator[Any]:
+    """Схема отчёта с данными, закоммиченная для кода, который открывает свои соединения; удаляется после теста."""
+    with db_session.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(SCHEMA_DDL)
+            fill_report_fixture(cursor)
+        conn.commit()
+    try:
+        yield db_session
+    finally:
+        with db_session.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"drop schema {', '.join(REPORT_SCHEMAS)} cascade")
+            conn.commit()
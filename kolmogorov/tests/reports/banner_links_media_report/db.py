@@ -0,0 +1,255 @@
+import os
+import random
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Final
+
+from lib.reports.banner_links_media_report.repo import ReportBannerLinksMediaRepo
+from lib.time import TimeRange
+
+REPORT_RANGE: Final = TimeRange(from_in=datetime(2024, 3, 1), to_in=datetime(2024, 3, 8))
+FIXTURE_CLICKS: Final = 3000
+# Размер фикстуры для бенчмарков запросов
+BENCHMARK_CLICKS: Final = int(os.environ.get("BENCHMARK_CLICKS", "300000"))
+REPORT_QUERIES: Final = {
+    "get_q": ReportBannerLinksMediaRepo().get_q(REPORT_RANGE),
+    "get_all_q": ReportBannerLinksMediaRepo().get_all_q(REPORT_RANGE),
+    "get_combined_q": ReportBannerLinksMediaRepo().get_combined_q(REPORT_RANGE),
+    "get_daily_q": ReportBannerLinksMediaRepo().get_daily_q(REPORT_RANGE),
+}
+USER_COURSE_PROGRESS_INDEX: Final = "user_course_progress_user_id_time_created_idx"
+
+REPORT_SCHEMAS: Final = ["noopolis", "analytics", "stat"]
+
+MIGRATIONS_DIR: Final = Path(__file__).parents[3] / "sql" / "banner_links_media_report"
+
+# Исходные таблицы noopolis/stat и analytics.banner_links_media, которые ведут другие сервисы
+SOURCE_DDL: Final = f"""
+create schema noopolis;
+create schema analytics;
+create schema stat;
+
+create table noopolis.metrics_banner (
+    id bigint primary key,
+    link_reference text,
+    description text,
+    type text,
+    time_created timestamp
+);
+create table noopolis.metrics_banner_click (
+    id bigserial primary key,
+    banner_id bigint,
+    user_id bigint,
+    time_follow timestamp
+);
+create index on noopolis.metrics_banner_click (time_follow);
+create table noopolis.user_course_progress (
+    id bigint primary key,
+    user_id bigint,
+    course_id bigint,
+    time_created timestamp
+);
+create index {USER_COURSE_PROGRESS_INDEX} on noopolis.user_course_progress (user_id, time_created);
+create table noopolis.course_module (
+    id bigint primary key,
+    type text,
+    level int,
+    is_deleted boolean
+);
+create table noopolis.user_module_progress (
+    id bigint primary key,
+    user_id bigint,
+    course_id bigint,
+    course_progress_id bigint,
+    course_module_id bigint,
+    is_deleted boolean,
+    is_achieved boolean,
+    is_available boolean,
+    time_updated timestamp
+);
+create index on noopolis.user_module_progress (course_progress_id);
+
+create table analytics.banner_links_media (
+    banner_id bigint,
+    banner_link text,
+    link text,
+    title text,
+    publication_type text,
+    channel text,
+    partner text,
+    is_outer boolean,
+    is_technical boolean,
+    is_deleted boolean default false,
+    time_created timestamp
+);
+create table analytics.excluded_course_students (user_id bigint);
+create table stat.excluded_users (user_id bigint);
+"""
+
+# Таблицы, которые ведёт сам отчёт, создаются теми же миграциями, что и в базе
+SCHEMA_DDL: Final = SOURCE_DDL + "\n".join(path.read_text() for path in sorted(MIGRATIONS_DIR.glob("*.sql")))
+
+OLD_DESCRIPTION: Final = (
+    "Соцсеть: ВК. Паблик/профиль: {partner}. Тип публикации: Пост. "
+    "Дата публикации: 01.02.2024. Название публикации: Баннер {banner_id}."
+)
+PARTNERS: Final = ["Сириус", "МГУ", "Паблик"]
+
+
+def _insert(cursor: Any, table: str, columns: list[str], rows: list[tuple[Any, ...]]) -> None:
+    from psycopg2.extras import execute_values
+
+    if rows:
+        execute_values(cursor, f"insert into {table}({', '.join(columns)}) values %s", rows, page_size=5000)
+
+
+def fill_report_fixture(cursor: Any, clicks: int = FIXTURE_CLICKS, seed: int = 0) -> None:
+    """Заполняет схему случайными, но воспроизводимыми данными вокруг REPORT_RANGE.
+
+    Баннеры по id % 6: новые, разобранные старые, сырые старые, не медийные, удалённые новые,
+    новые с дублем в разобранных. Переходы и регистрации попадают и на границы диапазона
+    и 30-минутного окна, часть пользователей анонимна или исключена.
+    """
+    rng = random.Random(seed)
+    banner_count = max(30, clicks // 50)
+    user_count = max(50, clicks // 5)
+    start = REPORT_RANGE.from_in - timedelta(days=2)
+    span = (REPORT_RANGE.to_in - REPORT_RANGE.from_in + timedelta(days=4)).total_seconds()
+
+    banners, new_banners, legacy_banners = [], [], []
+    for banner_id in range(1, banner_count + 1):
+        kind = banner_id % 6
+        partner = rng.choice(PARTNERS)
+        is_media = kind != 3
+        description = OLD_DESCRIPTION.format(partner=partner, banner_id=banner_id) if is_media else "Другое"
+        link = f"https://sirius.online/b/{banner_id}"
+        banners.append((banner_id, link, description, "link", start))
+        if kind in (0, 4, 5):
+            new_banners.append(
+                (banner_id, link, f"Новый {banner_id}", "Пост", "ВК", partner, partner == "Паблик", kind == 4, start)
+            )
+        if kind in (1, 5):
+            legacy_banners.append(
+                (banner_id, link, f"Разобранный {banner_id}", "Сторис", "Телеграм", partner, False, start)
+            )
+
+    click_rows = []
+    for _ in range(clicks):
+        user_id = None if rng.random() < 0.05 else rng.randint(1, user_count)
+        time_follow = start + timedelta(seconds=int(rng.random() * span))
+        click_rows.append((rng.randint(1, banner_count), user_id, time_follow))
+
+    registrations, module_progress = [], []
+    for _, user_id, time_follow in click_rows:
+        if user_id is None or rng.random() > 0.4:
+            continue
+        for _ in range(rng.choice([1, 1, 2])):
+            offset = rng.choice([-1, 0, 1, 5, 29, 30, 31, 45])
+            registration_id = len(registrations) + 1
+            registrations.append((registration_id, user_id, rng.randint(1, 5), time_follow + timedelta(minutes=offset)))
+            for _ in range(rng.choice([0, 1, 1, 2])):
+                module_progress.append(
+                    (
+                        len(module_progress) + 1,
+                        user_id,
+                        registrations[-1][2],
+                        registration_id,
+                        rng.randint(1, 4),
+                        rng.random() < 0.1,
+                        rng.random() < 0.7,
+                        rng.random() < 0.5,
+                        None if rng.random() < 0.5 else time_follow,
+                    )
+                )
+
+    first_clicks: dict[int, list[datetime]] = {}
+    for banner_id, _, time_follow in sorted(click_rows, key=lambda row: row[2]):
+        first_clicks.setdefault(banner_id, []).append(time_follow)
+
+    _insert(cursor, "noopolis.metrics_banner", ["id", "link_reference", "description", "type", "time_created"], banners)
+    _insert(cursor, "noopolis.metrics_banner_click", ["banner_id", "user_id", "time_follow"], click_rows)
+    _insert(cursor, "noopolis.user_course_progress", ["id", "user_id", "course_id", "time_created"], registrations)
+    _insert(
+        cursor,
+        "noopolis.course_module",
+        ["id", "type", "level", "is_deleted"],
+        [(1, "ordinary", 1, False), (2, "ordinary", 2, False), (3, "ordinary", 1, True), (4, "exam", 1, False)],
+    )
+    _insert(
+        cursor,
+        "noopolis.user_module_progress",
+        [
+            "id",
+            "user_id",
+            "course_id",
+            "course_progress_id",
+            "course_module_id",
+            "is_deleted",
+            "is_achieved",
+            "is_available",
+            "time_updated",
+        ],
+        module_progress,
+    )
+    _insert(
+        cursor,
+        "analytics.banner_links_media",
+        [
+            "banner_id",
+            "link",
+            "title",
+            "publication_type",
+            "channel",
+            "partner",
+            "is_outer",
+            "is_deleted",
+            "time_created",
+        ],
+        new_banners,
+    )
+    _insert(
+        cursor,
+        "analytics.banner_links_media_legacy",
+        ["banner_id", "link", "title", "publication_type", "channel", "partner", "is_outer", "time_created"],
+        legacy_banners,
+    )
+    _insert(
+        cursor,
+        "analytics.banner_first_clicks",
+        ["banner_id", "first_clicks", "time_updated"],
+        [(banner_id, times[:10], start) for banner_id, times in first_clicks.items()],
+    )
+    _insert(
+        cursor,
+        "analytics.excluded_course_students",
+        ["user_id"],
+        [(user_id,) for user_id in range(1, user_count + 1) if user_id % 20 == 0],
+    )
+    _insert(
+        cursor,
+        "stat.excluded_users",
+        ["user_id"],
+        [(user_id,) for user_id in range(1, user_count + 1) if user_id % 20 in (0, 10)],
+    )
+    cursor.execute("refresh materialized view analytics.banner_links_media_excluded_users")
+    cursor.execute("analyze")
+
+
+def fetch(cursor: Any, q: str) -> list[dict[str, Any]]:
+    # Запросы отчёта рассчитаны на perform_q(q, []): литеральный % в них удвоен
+    cursor.execute(q, [])
+    columns = [column.name for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def _plan_nodes(plan: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def explain(cursor: Any, q: str) -> list[dict[str, Any]]:
+    """Узлы плана EXPLAIN (format json) в порядке обхода в глубину."""
+    cursor.execute(f"explain (format json) {q}", [])
+    return list(_plan_nodes(cursor.fetchone()[0][0]["Plan"]))
@@ -0,0 +1,59 @@
+from typing import Any
+
+import pandas as pd
+import pytest
+
+from lib.reports.banner_links_media_report.export import iter_table_chunks
+from lib.reports.banner_links_media_report.parallel import ParallelQueryRunner
+from lib.reports.banner_links_media_report.repo import ReportBannerLinksMediaRepo
+
+from .db import REPORT_RANGE, fetch
+
+TOTAL_ROW_ID = "Итог"
+
+
+def _by_id(rows: list[dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    return {str(row["id"]): {**row, "id": str(row["id"])} for row in rows}
+
+
+@pytest.mark.parametrize("nth_click", [5, 1, 10])
+def test_combined_q_matches_get_q_and_get_all_q(report_db: Any, nth_click: int) -> None:
+    repo = ReportBannerLinksMediaRepo()
+    expected = _by_id(fetch(report_db, repo.get_q(REPORT_RANGE, nth_click)))
+    expected.update(_by_id(fetch(report_db, repo.get_all_q(REPORT_RANGE))))
+
+    actual = _by_id(fetch(report_db, repo.get_combined_q(REPORT_RANGE, nth_click)))
+
+    assert actual == expected
+
+
+def test_fixture_covers_report_cases(report_db: Any) -> None:
+    # Без регистраций, активаций и всех видов баннеров сравнение выше было бы пустым
+    rows = _by_id(fetch(report_db, ReportBannerLinksMediaRepo().get_combined_q(REPORT_RANGE)))
+    total = rows.pop(TOTAL_ROW_ID)
+    banners = list(rows.values())
+
+    assert total["clicks"] > sum(row["clicks"] for row in banners)
+    assert all(total[column] > 0 for column in ["regs", "active"])
+    assert any(row["active"] > 0 for row in banners)
+    assert {row["title"].split()[0] for row in banners} == {"Новый", "Разобранный", "Соцсеть:"}
+    assert all(row["fact_publication_date"] is not None for row in banners)
+
+
+def test_export_q_streams_rows_in_export_order(committed_report_db: Any) -> None:
+    repo = ReportBannerLinksMediaRepo()
+    runner = ParallelQueryRunner(committed_report_db)  # type: ignore[arg-type]
+    table = runner.run_one(repo.get_combined_q(REPORT_RANGE))
+    expected = pd.concat(list(iter_table_chunks(table)), ignore_index=True)
+
+    chunks = list(runner.iter_chunks(repo.get_combined_export_q(REPORT_RANGE), chunk_rows=50))
+    streamed = pd.concat(chunks, ignore_index=True)
+
+    assert len(chunks) == -(-len(table) // 50)
+    assert streamed["id"].iloc[-1] == TOTAL_ROW_ID
+    # Внутри одного дня порядок строк не задан, поэтому совпадать должны даты по порядку и строки как множество
+    for frame in (streamed, expected):
+        frame["day"] = frame["fact_publication_date"].map(lambda x: x.strftime("%d.%m.%Y") if pd.notna(x) else "")
+    assert streamed["day"].tolist() == expected["day"].tolist()
+    records = [frame.astype(object).where(frame.notna(), None).to_dict("records") for frame in (streamed, expected)]
+    assert _by_id(records[0]) == _by_id(records[1])
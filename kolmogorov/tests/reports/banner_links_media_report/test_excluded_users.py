@@ -0,0 +1,124 @@
+import os
+from typing import Any
+
+import pytest
+
+from lib.reports.banner_links_media_report.repo import EXCLUDED_USERS, ReportBannerLinksMediaRepo
+
+from .db import BENCHMARK_CLICKS, REPORT_QUERIES, REPORT_RANGE, explain, fetch
+
+psycopg2_errors = pytest.importorskip("psycopg2.errors")
+
+# Столько исключённых union уже не помещает в work_mem по умолчанию
+BENCHMARK_EXCLUDED = int(os.environ.get("BENCHMARK_EXCLUDED", "400000"))
+BENCHMARK_TIMEOUT_SECONDS = 60
+EXCLUDED_RELATION = EXCLUDED_USERS.split(".")[1]
+
+REPO = ReportBannerLinksMediaRepo()
+
+# Фильтр переходов до материализованного представления: union источников и not in в каждом запросе
+UNION_NOT_IN_Q = f"""with excluded as (
+    select user_id from analytics.excluded_course_students
+    union
+    select user_id from stat.excluded_users
+)
+select count(*) as clicks
+from noopolis.metrics_banner_click
+where {REPORT_RANGE.as_sql('time_follow')}
+  and coalesce(user_id, 0) not in (select user_id from excluded)
+"""
+ANTI_JOIN_Q = f"""select count(*) as clicks
+from noopolis.metrics_banner_click m
+where {REPORT_RANGE.as_sql('time_follow')}
+  and not exists (
+    select 1
+    from {EXCLUDED_USERS} e
+    where e.user_id = coalesce(m.user_id, 0)
+  )
+"""
+
+
+def _scans_excluded(nodes: list[dict[str, Any]]) -> bool:
+    return any(node.get("Relation Name") == EXCLUDED_RELATION for node in nodes)
+
+
+def _subtree(node: dict[str, Any]) -> list[dict[str, Any]]:
+    return [node, *(child for plan in node.get("Plans", []) for child in _subtree(plan))]
+
+
+@pytest.mark.parametrize("name", REPORT_QUERIES)
+def test_excluded_users_probed_by_anti_join(report_db: Any, name: str) -> None:
+    nodes = explain(report_db, REPORT_QUERIES[name])
+
+    anti_joins = [node for node in nodes if node.get("Join Type") == "Anti"]
+    assert any(_scans_excluded(_subtree(node)) for node in anti_joins)
+    subplans = [node for node in nodes if node.get("Parent Relationship") == "SubPlan"]
+    assert not any(_scans_excluded(_subtree(node)) for node in subplans)
+    assert "excluded_course_students" not in REPORT_QUERIES[name]
+
+
+def test_refresh_picks_up_new_exclusions(report_db: Any) -> None:
+    before = fetch(report_db, ANTI_JOIN_Q)[0]["clicks"]
+    report_db.execute(
+        f"""insert into stat.excluded_users(user_id)
+        select distinct coalesce(user_id, 0)
+        from noopolis.metrics_banner_click
+        where {REPORT_RANGE.as_sql('time_follow')}
+          and coalesce(user_id, 0) % 7 = 1
+        """
+    )
+    assert fetch(report_db, ANTI_JOIN_Q)[0]["clicks"] == before
+
+    report_db.execute(REPO.get_refresh_excluded_q())
+
+    after = fetch(report_db, ANTI_JOIN_Q)[0]["clicks"]
+    assert after < before
+    assert after == fetch(report_db, UNION_NOT_IN_Q)[0]["clicks"]
+
+
+def _best_time(cursor: Any, stopwatch: Any, label: str, q: str, runs: int = 3) -> int | None:
+    """Число переходов по q и лучшее из runs время в stopwatch; при превышении BENCHMARK_TIMEOUT_SECONDS — None."""
+    clicks = None
+    for _ in range(runs):
+        cursor.execute("savepoint benchmark")
+        cursor.execute(f"set local statement_timeout = '{BENCHMARK_TIMEOUT_SECONDS}s'")
+        try:
+            with stopwatch.measure(label):
+                clicks = fetch(cursor, q)[0]["clicks"]
+        except psycopg2_errors.QueryCanceled:
+            cursor.execute("rollback to savepoint benchmark")
+            stopwatch.seconds[label] = float("inf")
+            return None
+        cursor.execute("release savepoint benchmark")
+    return clicks
+
+
+@pytest.mark.benchmark
+def test_excluded_users_benchmark(benchmark_report_db: Any, stopwatch: Any) -> None:
+    """Сравнивает фильтр исключённых: union + not in против anti-join по материализованному представлению.
+
+    Пока union помещается в work_mem, not in выполняется хешированным подпланом и сопоставим с anti-join;
+    на большом множестве подплан становится построчным, а anti-join остаётся хеш-соединением.
+    """
+    cursor = benchmark_report_db
+    small = [
+        _best_time(cursor, stopwatch, "fixture union + not in", UNION_NOT_IN_Q),
+        _best_time(cursor, stopwatch, "fixture anti-join", ANTI_JOIN_Q),
+    ]
+
+    cursor.execute(
+        f"""insert into analytics.excluded_course_students(user_id)
+        select g
+        from generate_series(1000000, 1000000 + {BENCHMARK_EXCLUDED} - 1) g
+        """
+    )
+    cursor.execute(REPO.get_refresh_excluded_q())
+    cursor.execute("analyze")
+    union_clicks = _best_time(cursor, stopwatch, "large union + not in", UNION_NOT_IN_Q)
+    anti_join_clicks = _best_time(cursor, stopwatch, "large anti-join", ANTI_JOIN_Q)
+
+    stopwatch.report(f"{BENCHMARK_CLICKS} clicks, large set has {BENCHMARK_EXCLUDED} more excluded")
+    assert small[0] == small[1]
+    assert anti_join_clicks is not None
+    assert union_clicks in (None, anti_join_clicks)
+    assert stopwatch.seconds["large anti-join"] < stopwatch.seconds["large union + not in"]
@@ -0,0 +1,87 @@
+import io
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from lib.reports.banner_links_media_report.export import (
+    TOTAL_ROW_ID,
+    ReportFormat,
+    iter_table_chunks,
+    write_report,
+    write_report_csv,
+)
+
+
+def _report_table() -> pd.DataFrame:
+    """Строки как из get_combined_q: даты вразнобой, одна пустая, «Итог» не последний."""
+    days = [datetime(2024, 3, 2), None, datetime(2024, 2, 11), datetime(2024, 3, 2, 15), datetime(2023, 12, 30)]
+    rows = [
+        {
+            "id": str(i),
+            "link": f"https://sirius.online/b/{i}",
+            "channel": "ВК",
+            "partner": "Сириус",
+            "partner_type": i % 2 == 0,
+            "publication_type": "Пост",
+            "fact_publication_date": day,
+            "title": "Олимпиада",
+            "clicks": 10 * (i + 1),
+            "regs": i,
+            "active": i // 2,
+        }
+        for i, day in enumerate(days)
+    ]
+    total = {"id": TOTAL_ROW_ID, "fact_publication_date": None, "clicks": 150, "regs": 10, "active": 4}
+    return pd.DataFrame(rows[:2] + [total] + rows[2:])
+
+
+def _csv(chunks: list[pd.DataFrame]) -> str:
+    stream = io.StringIO()
+    write_report_csv(chunks, stream)
+    return stream.getvalue()
+
+
+def test_table_chunks_are_in_export_order() -> None:
+    chunks = list(iter_table_chunks(_report_table(), chunk_rows=2))
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1, 1]
+    ids = [row_id for chunk in chunks for row_id in chunk["id"]]
+    # «дд.мм.гггг» сравнивается как строка: пустая дата первой, 02.03.2024 раньше 11.02.2024
+    assert ids == ["1", "0", "3", "2", "4", TOTAL_ROW_ID]
+
+
+def test_csv_does_not_depend_on_chunk_size() -> None:
+    whole = _csv(list(iter_table_chunks(_report_table(), chunk_rows=100)))
+    chunked = _csv(list(iter_table_chunks(_report_table(), chunk_rows=1)))
+
+    assert chunked == whole
+    lines = whole.splitlines()
+    assert len(lines) == 7
+    assert lines[-1].startswith(f"{TOTAL_ROW_ID},")
+
+
+def test_parquet_is_written_by_chunks(tmp_path: pytest.TempPathFactory) -> None:
+    pytest.importorskip("pyarrow")
+    path = str(tmp_path / "report.parquet")  # type: ignore[operator]
+
+    write_report(iter_table_chunks(_report_table(), chunk_rows=2), path, ReportFormat.PARQUET)
+
+    report = pd.read_parquet(path)
+    assert report["id"].tolist() == ["1", "0", "3", "2", "4", TOTAL_ROW_ID]
+    assert report["Переходы"].dtype == "int64"
+    assert pd.isna(report["Фактическая дата публикации"].iloc[0])
+    assert str(report["Фактическая дата публикации"].iloc[1]) == "2024-03-02"
+    assert pd.isna(report["Канал"].iloc[-1])
+
+
+def test_xlsx_is_written_by_chunks(tmp_path: pytest.TempPathFactory) -> None:
+    openpyxl = pytest.importorskip("openpyxl")
+    path = str(tmp_path / "report.xlsx")  # type: ignore[operator]
+
+    write_report(iter_table_chunks(_report_table(), chunk_rows=2), path, ReportFormat.XLSX)
+
+    rows = list(openpyxl.load_workbook(path).active.iter_rows(values_only=True))
+    assert rows[0][:3] == ("id", "Ссылка", "Канал")
+    assert [row[0] for row in rows[1:]] == ["1", "0", "3", "2", "4", TOTAL_ROW_ID]
+    assert rows[-1][rows[0].index("Переходы")] == 150
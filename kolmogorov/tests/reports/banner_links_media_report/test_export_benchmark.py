@@ -0,0 +1,91 @@
+import os
+import tracemalloc
+from collections.abc import Callable
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lib.reports.banner_links_media_report.export import REPORT_RENAMES, format_dates, format_report_chunk
+
+BENCHMARK_ROWS = int(os.environ.get("BENCHMARK_ROWS", "1000000"))
+COMPARED_COLUMNS = ["Фактическая дата публикации", "Переходы -> Регистрации", "Регистрации -> Активные"]
+
+
+def _synthetic_report(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Строки отчёта как из get_combined_q: все описания уже разобраны, часть дат пустая."""
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 700, rows), unit="D")
+    clicks = rng.integers(0, 5000, rows)
+    regs = (clicks * rng.random(rows)).astype("int64")
+    frame = pd.DataFrame(
+        {
+            "id": np.arange(rows),
+            "link": [f"https://sirius.online/b/{i}" for i in range(rows)],
+            "title": rng.choice(["Олимпиада", "Смена", "Курс", "Лекция"], rows),
+            "publication_type": rng.choice(["Пост", "Сторис", "Видео"], rows),
+            "channel": rng.choice(["ВК", "Телеграм", "ОК"], rows),
+            "partner": rng.choice(["Сириус", "МГУ", "Паблик"], rows),
+            "partner_type": rng.random(rows) < 0.5,
+            "fact_publication_date": pd.Series(dates).where(rng.random(rows) > 0.01),
+            "clicks": clicks,
+            "regs": regs,
+            "active": (regs * rng.random(rows)).astype("int64"),
+        }
+    )
+    return frame
+
+
+def _baseline(table: pd.DataFrame) -> pd.DataFrame:
+    # Постобработка до векторизации: дата построчно, конверсии через round, rename с копией
+    table["fact_publication_date"] = table["fact_publication_date"].apply(
+        lambda x: pd.Timestamp(x).date().strftime("%d.%m.%Y") if pd.notna(x) else ""
+    )
+    table = table.rename(columns=REPORT_RENAMES)
+    table["Переходы -> Регистрации"] = round((table["Регистрации"] / table["Переходы"] * 100).fillna(0))
+    table["Регистрации -> Активные"] = round((table["Активные"] / table["Регистрации"] * 100).fillna(0))
+    return table
+
+
+def _vectorized(table: pd.DataFrame) -> pd.DataFrame:
+    table["fact_publication_date"] = format_dates(table["fact_publication_date"])
+    return format_report_chunk(table)
+
+
+def _measure(
+    func: Callable[[pd.DataFrame], pd.DataFrame], rows: int, stopwatch: Any, label: str
+) -> tuple[pd.DataFrame, int]:
+    # Время и пик памяти меряются отдельными прогонами: tracemalloc сильно замедляет pandas
+    table = _synthetic_report(rows)
+    with stopwatch.measure(label):
+        result = func(table)
+
+    table = _synthetic_report(rows)
+    tracemalloc.start()
+    func(table)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak
+
+
+def test_vectorized_post_processing_matches_baseline() -> None:
+    baseline = _baseline(_synthetic_report(1000))
+    vectorized = _vectorized(_synthetic_report(1000))
+
+    for column in COMPARED_COLUMNS:
+        assert vectorized[column].tolist() == baseline[column].tolist()
+
+
+@pytest.mark.benchmark
+def test_vectorized_post_processing_is_faster(stopwatch: Any) -> None:
+    baseline, baseline_peak = _measure(_baseline, BENCHMARK_ROWS, stopwatch, "baseline")
+    vectorized, vectorized_peak = _measure(_vectorized, BENCHMARK_ROWS, stopwatch, "vectorized")
+
+    stopwatch.report(
+        f"{BENCHMARK_ROWS} rows, peak baseline {baseline_peak / 2**20:.0f} MiB, "
+        f"vectorized {vectorized_peak / 2**20:.0f} MiB"
+    )
+    for column in COMPARED_COLUMNS:
+        assert vectorized[column].tolist() == baseline[column].tolist()
+    assert stopwatch.seconds["vectorized"] < stopwatch.seconds["baseline"]
@@ -0,0 +1,35 @@
+import time
+from typing import Any
+
+import pytest
+
+from lib.reports.banner_links_media_report.parallel import ParallelQueryRunner, QueryDeadlineExceeded
+
+
+def test_runs_queries_on_own_connections(db_session: Any) -> None:
+    runner = ParallelQueryRunner(db_session)  # type: ignore[arg-type]
+
+    results = runner.run(["select pg_backend_pid() as pid, 1 as n", "select pg_backend_pid() as pid, 2 as n"])
+
+    assert [frame["n"].tolist() for frame in results] == [[1], [2]]
+    assert results[0]["pid"][0] != results[1]["pid"][0]
+
+
+def test_failed_query_cancels_running_sibling(db_session: Any) -> None:
+    runner = ParallelQueryRunner(db_session)  # type: ignore[arg-type]
+
+    started = time.monotonic()
+    with pytest.raises(Exception, match="division by zero"):
+        runner.run(["select pg_sleep(30)", "select pg_sleep(0.5), 1 / 0"])
+
+    assert time.monotonic() - started < 10
+
+
+def test_deadline_cancels_running_queries(db_session: Any) -> None:
+    runner = ParallelQueryRunner(db_session, deadline_seconds=1)  # type: ignore[arg-type]
+
+    started = time.monotonic()
+    with pytest.raises(QueryDeadlineExceeded):
+        runner.run(["select pg_sleep(30)", "select pg_sleep(30)"])
+
+    assert time.monotonic() - started < 10
@@ -0,0 +1,121 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lib.reports.banner_links_media_report.parsing import KNOWN_PARTNERS, parse, table_parse
+
+TITLE = (
+    "Соцсеть: {channel}. Паблик/профиль: {partner}. Тип публикации: {publication_type}. "
+    "Дата публикации: 01.02.2024. Название публикации: {title}."
+)
+PROFILE_TITLE = (
+    "Соцсеть: {channel}. Профиль: {partner}. Тип публикации: {publication_type}. "
+    "Дата публикации: 03.04.2024. Название публикации: {title}."
+)
+
+
+def _baseline_parse(title: str) -> dict[str, str]:
+    # Разбор до векторизации: перекомпиляция шаблона и поиск партнёра в списке
+    pattern = (
+        r"Соцсеть:\s*(.*?)\.\s*"
+        r"(?:Паблик/профиль|Профиль):\s*(.*?)\.\s*"
+        r"Тип публикации:\s*(.*?)\.\s*"
+        r"Дата публикации:\s*(.*?)\.\s*"
+        r"Название публикации:\s*(.*?)\."
+    )
+    match = re.search(pattern, title)
+    if not match:
+        return {"title": title}
+
+    channel, partner, type_publication, date_publication, name_publication = match.groups()
+    partner_type = "внутренний" if partner.strip() in KNOWN_PARTNERS else "внешний"
+    return {
+        "channel": channel.strip(),
+        "partner": partner.strip(),
+        "partner_type": partner_type,
+        "publication_type": type_publication.strip(),
+        "title": name_publication.strip(),
+    }
+
+
+def _baseline_table_parse(df: pd.DataFrame) -> pd.DataFrame:
+    parsed_columns = df["title"].apply(lambda x: pd.Series(_baseline_parse(x)))
+    df.update(parsed_columns)
+    return df
+
+
+def _sample_frame() -> pd.DataFrame:
+    titles = [
+        TITLE.format(channel="ВК", partner="Сириус", publication_type="Пост", title="Олимпиада"),
+        TITLE.format(channel=" Телеграм ", partner=" МГУ ", publication_type=" Сторис ", title=" Курс "),
+        TITLE.format(channel="ВК", partner="Неизвестный паблик", publication_type="Пост", title="Смена"),
+        PROFILE_TITLE.format(channel="ОК", partner="Сириус.Курсы", publication_type="Видео", title="Лекция"),
+        "Описание без разметки",
+        "Соцсеть: ВК. Паблик/профиль: Сириус. Без типа публикации",
+        "",
+    ]
+    return pd.DataFrame(
+        {
+            "banner_id": range(len(titles)),
+            "title": titles,
+            "channel": [np.nan] * len(titles),
+            "partner": [np.nan] * len(titles),
+            "partner_type": [np.nan] * len(titles),
+            "publication_type": [np.nan] * len(titles),
+        },
+        dtype=object,
+    )
+
+
+def _already_parsed_frame() -> pd.DataFrame:
+    # Строки из разобранной таблицы: описание уже заменено названием публикации
+    return pd.DataFrame(
+        {
+            "banner_id": [100, 101],
+            "title": ["Олимпиада", "Смена"],
+            "channel": ["ВК", "Телеграм"],
+            "partner": ["Сириус", "Паблик"],
+            "partner_type": ["внутренний", "внешний"],
+            "publication_type": ["Пост", "Сторис"],
+        },
+        dtype=object,
+    )
+
+
+@pytest.mark.parametrize("title", _sample_frame()["title"].tolist())
+def test_parse_matches_baseline(title: str) -> None:
+    assert parse(title) == _baseline_parse(title)
+
+
+def test_table_parse_matches_baseline() -> None:
+    frame = pd.concat([_sample_frame(), _already_parsed_frame()], ignore_index=True)
+
+    expected = _baseline_table_parse(frame.copy())
+    actual = table_parse(frame.copy())
+
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_table_parse_golden() -> None:
+    actual = table_parse(_sample_frame())
+
+    assert actual[["channel", "partner", "partner_type", "publication_type", "title"]].head(4).values.tolist() == [
+        ["ВК", "Сириус", "внутренний", "Пост", "Олимпиада"],
+        ["Телеграм", "МГУ", "внутренний", "Сторис", "Курс"],
+        ["ВК", "Неизвестный паблик", "внешний", "Пост", "Смена"],
+        ["ОК", "Сириус.Курсы", "внутренний", "Видео", "Лекция"],
+    ]
+    assert actual["title"].tail(3).tolist() == [
+        "Описание без разметки",
+        "Соцсеть: ВК. Паблик/профиль: Сириус. Без типа публикации",
+        "",
+    ]
+    assert actual["channel"].tail(3).isna().all()
+
+
+def test_table_parse_keeps_parsed_rows() -> None:
+    frame = _already_parsed_frame()
+
+    pd.testing.assert_frame_equal(table_parse(frame.copy()), frame)
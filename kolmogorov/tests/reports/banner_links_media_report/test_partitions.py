@@ -0,0 +1,59 @@
+from datetime import datetime
+from typing import Any
+
+import pytest
+
+from lib.reports.banner_links_media_report.repo import ReportBannerLinksMediaRepo
+
+from .db import BENCHMARK_CLICKS, REPORT_RANGE, fetch
+
+BENCHMARK_PARTITIONS = 4
+
+
+def _daily_rows(cursor: Any, queries: list[str]) -> list[tuple[Any, ...]]:
+    rows = [row for q in queries for row in fetch(cursor, q)]
+    return sorted(
+        (
+            row["day"],
+            row["banner_id"],
+            row["clicks"],
+            sorted(row["reg_ids"]),
+            sorted(row["active_reg_ids"]),
+            sorted(row["active_keys"]),
+        )
+        for row in rows
+    )
+
+
+@pytest.mark.parametrize("partitions", [2, 3, 7])
+@pytest.mark.parametrize("count_from", [None, datetime(2024, 3, 4, 12)])
+def test_partitions_match_single_query(report_db: Any, partitions: int, count_from: datetime | None) -> None:
+    repo = ReportBannerLinksMediaRepo()
+    single = _daily_rows(report_db, [repo.get_daily_q(REPORT_RANGE, count_from=count_from)])
+
+    partitioned = _daily_rows(report_db, repo.get_daily_partitioned_q(REPORT_RANGE, partitions, count_from))
+
+    assert single
+    assert partitioned == single
+
+
+@pytest.mark.benchmark
+def test_partitioned_benchmark(benchmark_report_db: Any, stopwatch: Any) -> None:
+    """Сравнивает один запрос с частями по banner_id.
+
+    Части выполняются здесь по очереди в одной транзакции с фикстурой; в отчёте они идут параллельно
+    через ParallelQueryRunner, так что время там определяет самая долгая часть.
+    """
+    repo = ReportBannerLinksMediaRepo()
+    with stopwatch.measure("single"):
+        single = _daily_rows(benchmark_report_db, [repo.get_daily_q(REPORT_RANGE)])
+
+    partitioned = []
+    for part, q in enumerate(repo.get_daily_partitioned_q(REPORT_RANGE, BENCHMARK_PARTITIONS)):
+        with stopwatch.measure(f"partition {part}"):
+            partitioned.extend(_daily_rows(benchmark_report_db, [q]))
+
+    stopwatch.report(f"{BENCHMARK_CLICKS} clicks, {BENCHMARK_PARTITIONS} partitions")
+    assert sorted(partitioned) == single
+    single_seconds = stopwatch.seconds.pop("single")
+    assert max(stopwatch.seconds.values()) < single_seconds
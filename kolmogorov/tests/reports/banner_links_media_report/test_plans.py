@@ -0,0 +1,45 @@
+from typing import Any
+
+import pytest
+
+from .db import REPORT_QUERIES, REPORT_RANGE, USER_COURSE_PROGRESS_INDEX, explain
+
+# Привязка регистраций до переноса окна в lateral: верхняя граница не sargable
+UNBOUNDED_REGS_Q = f"""select
+    ucp.id
+from noopolis.metrics_banner_click c
+    join noopolis.user_course_progress ucp
+      on c.user_id = ucp.user_id
+where {REPORT_RANGE.as_sql('c.time_follow')}
+  and ucp.time_created > c.time_follow
+  and (ucp.time_created - c.time_follow) <= interval '30 minutes'
+"""
+
+
+def _registration_probes(cursor: Any, q: str) -> list[str]:
+    # Соединения по хешу и слиянием выключены, чтобы планировщик показал, что попадает в условие индекса
+    cursor.execute("set local enable_seqscan = off")
+    cursor.execute("set local enable_hashjoin = off")
+    cursor.execute("set local enable_mergejoin = off")
+    nodes = explain(cursor, q)
+    seq_scans = [node for node in nodes if node["Node Type"] == "Seq Scan"]
+    assert all(node["Relation Name"] != "user_course_progress" for node in seq_scans)
+    return [node["Index Cond"] for node in nodes if node.get("Index Name") == USER_COURSE_PROGRESS_INDEX]
+
+
+@pytest.mark.parametrize("name", REPORT_QUERIES)
+def test_registration_window_is_index_cond(report_db: Any, name: str) -> None:
+    probes = _registration_probes(report_db, REPORT_QUERIES[name])
+
+    assert probes
+    for cond in probes:
+        assert "user_id =" in cond
+        assert "time_created >" in cond
+        assert "time_created <=" in cond
+
+
+def test_unbounded_window_is_detected(report_db: Any) -> None:
+    probes = _registration_probes(report_db, UNBOUNDED_REGS_Q)
+
+    assert probes
+    assert all("time_created <=" not in cond for cond in probes)
@@ -0,0 +1,108 @@
+from datetime import date, datetime, timedelta
+from typing import Any
+
+import pandas as pd
+
+from lib.reports.banner_links_media_report.repo import ReportBannerLinksMediaRepo
+from lib.reports.banner_links_media_report.slices import DAILY_COLUMNS, split_by_day
+from lib.time import TimeRange
+
+from .db import REPORT_RANGE, fetch
+
+FIRST_DAY = REPORT_RANGE.from_in.date()
+# День без переходов: в агрегате у него нет строк, но он всё равно готов
+EMPTY_DAY = date(2023, 1, 1)
+BANNER_ID = 1
+CLICK_TIME = datetime(2024, 3, 1, 12)
+
+
+def _refresh(cursor: Any, from_date: date, to_date: date) -> None:
+    repo = ReportBannerLinksMediaRepo()
+    tr = TimeRange(from_in=datetime.combine(from_date, datetime.min.time()), to_in=REPORT_RANGE.to_in)
+    for q in repo.get_refresh_daily_q(from_date, to_date, tr):
+        cursor.execute(q, [])
+
+
+def _normalized(daily: pd.DataFrame) -> list[tuple[Any, ...]]:
+    return sorted(
+        (row.day, row.banner_id, row.clicks, *(tuple(sorted(ids)) for ids in row[3:]))
+        for row in daily[DAILY_COLUMNS].itertuples(index=False)
+    )
+
+
+def test_refresh_daily_q_stores_get_daily_q_for_refreshed_days_only(report_db: Any) -> None:
+    repo = ReportBannerLinksMediaRepo()
+    days = [FIRST_DAY + timedelta(days=i) for i in range(4)]
+    expected = split_by_day(pd.DataFrame(fetch(report_db, repo.get_daily_q(REPORT_RANGE))), days)
+
+    _refresh(report_db, days[1], days[2])
+    # Повторный пересчёт заменяет дни, а не дописывает их
+    _refresh(report_db, days[1], days[2])
+    _refresh(report_db, EMPTY_DAY, EMPTY_DAY)
+
+    rollup = pd.DataFrame(fetch(report_db, repo.get_daily_rollup_q(days[0], days[-1])))
+    assert set(rollup["ready_day"]) == {days[1], days[2]}
+    stored = split_by_day(rollup[DAILY_COLUMNS], days[1:3])
+    for day in days[1:3]:
+        assert not stored[day].empty
+        assert _normalized(stored[day]) == _normalized(expected[day])
+
+    empty = fetch(report_db, repo.get_daily_rollup_q(EMPTY_DAY, EMPTY_DAY))
+    assert [(row["ready_day"], row["banner_id"]) for row in empty] == [(EMPTY_DAY, None)]
+
+
+def test_refresh_daily_q_keeps_days_outside_refreshed_range(report_db: Any) -> None:
+    repo = ReportBannerLinksMediaRepo()
+    first, second = FIRST_DAY, FIRST_DAY + timedelta(days=1)
+    _refresh(report_db, first, second)
+    before = fetch(report_db, repo.get_daily_rollup_q(first, first))
+
+    _refresh(report_db, second, second)
+
+    assert fetch(report_db, repo.get_daily_rollup_q(first, first)) == before
+
+
+def _add_clicks(cursor: Any, *minutes: int) -> None:
+    cursor.executemany(
+        "insert into noopolis.metrics_banner_click(banner_id, time_follow) values (%s, %s)",
+        [(BANNER_ID, CLICK_TIME + timedelta(minutes=minute)) for minute in minutes],
+    )
+
+
+def _refresh_first_clicks(cursor: Any) -> list[int]:
+    for q in ReportBannerLinksMediaRepo().get_refresh_first_clicks_q():
+        cursor.execute(q)
+    cursor.execute("select first_clicks from analytics.banner_first_clicks where banner_id = %s", [BANNER_ID])
+    return [int((t - CLICK_TIME).total_seconds() // 60) for t in cursor.fetchone()[0]]
+
+
+def test_refresh_first_clicks_keeps_equal_times_and_rereads_late_window(report_schema: Any) -> None:
+    _add_clicks(report_schema, 0, 0, 0, 1)
+    assert _refresh_first_clicks(report_schema) == [0, 0, 0, 1]
+
+    # Опоздавший переход раньше водяного знака попадает в окно, уже сохранённые не задваиваются
+    _add_clicks(report_schema, -60, 2)
+    assert _refresh_first_clicks(report_schema) == [-60, 0, 0, 0, 1, 2]
+    assert _refresh_first_clicks(report_schema) == [-60, 0, 0, 0, 1, 2]
+
+
+def test_fact_publication_date_counts_clicks_after_watermark(report_schema: Any) -> None:
+    repo = ReportBannerLinksMediaRepo()
+    report_schema.execute(
+        "insert into analytics.banner_links_media(banner_id, link, title) values (%s, 'link', 'Новый')", [BANNER_ID]
+    )
+    _add_clicks(report_schema, 0, 0, 1)
+    _refresh_first_clicks(report_schema)
+    _add_clicks(report_schema, 2, 3)
+
+    dates = {
+        nth_click: fetch(report_schema, repo.get_banners_q([BANNER_ID], nth_click))[0]["fact_publication_date"]
+        for nth_click in (2, 4, 5, 6)
+    }
+
+    assert dates == {
+        2: CLICK_TIME,
+        4: CLICK_TIME + timedelta(minutes=2),
+        5: CLICK_TIME + timedelta(minutes=3),
+        6: None,
+    }
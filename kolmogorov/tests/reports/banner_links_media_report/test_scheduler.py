@@ -0,0 +1,41 @@
+import zlib
+from typing import Any
+
+from lib.reports.banner_links_media_report.scheduler import JobScheduler, ScheduledJob
+
+
+def _jobs(calls: list[str]) -> list[ScheduledJob]:
+    def job(name: str) -> ScheduledJob:
+        def run(_: Any) -> None:
+            calls.append(name)
+            if name == "failing":
+                raise RuntimeError("boom")
+
+        return ScheduledJob(name, 100 if name != "fast" else 10, run)
+
+    return [job("failing"), job("fast"), job("slow")]
+
+
+def test_runs_due_jobs_in_order_by_their_intervals(db_session: Any) -> None:
+    calls: list[str] = []
+    scheduler = JobScheduler(_jobs(calls))
+
+    # Упавшее обновление не мешает следующим
+    assert scheduler.run_due(db_session, now=0) == ["fast", "slow"]
+    assert scheduler.run_due(db_session, now=5) == []
+    assert scheduler.run_due(db_session, now=10) == ["fast"]
+    assert scheduler.run_due(db_session, now=100) == ["fast", "slow"]
+    assert calls == ["failing", "fast", "slow", "fast", "failing", "fast", "slow"]
+
+
+def test_job_locked_by_another_process_is_skipped(db_session: Any) -> None:
+    calls: list[str] = []
+    scheduler = JobScheduler(_jobs(calls))
+
+    with db_session.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("select pg_advisory_lock(%s)", (zlib.crc32(b"banner_links_media.slow"),))
+        assert scheduler.run_due(db_session, now=0) == ["fast"]
+
+    assert "slow" not in calls
+    assert scheduler.run_due(db_session, now=100) == ["fast", "slow"]
@@ -0,0 +1,129 @@
+import time
+from datetime import date, datetime, timedelta
+from typing import Any
+
+import pandas as pd
+
+from lib.reports.banner_links_media_report.parallel import ParallelQueryRunner
+from lib.reports.banner_links_media_report.repo import ReportBannerLinksMediaRepo
+from lib.reports.banner_links_media_report.slices import (
+    DAILY_COLUMNS,
+    DaySliceCache,
+    LiveSliceCache,
+    load_daily_slices,
+    merge_slices,
+    refresh_activations,
+    split_by_day,
+)
+
+from .db import REPORT_RANGE
+
+KEY = (datetime(2024, 3, 8), datetime(2024, 3, 9))
+FIRST_DAY = REPORT_RANGE.from_in.date()
+LAST_DAY = REPORT_RANGE.to_in.date() - timedelta(days=1)
+
+
+def _daily(rows: list[tuple[int, int, list[int], list[int], list[str]]], day: date = date(2024, 3, 8)) -> pd.DataFrame:
+    return pd.DataFrame([(day, *row) for row in rows], columns=DAILY_COLUMNS)
+
+
+def _normalized(daily: pd.DataFrame) -> list[tuple[Any, ...]]:
+    return sorted(
+        (row.day, row.banner_id, row.clicks, *(tuple(sorted(ids)) for ids in row[3:]))
+        for row in daily[DAILY_COLUMNS].itertuples(index=False)
+    )
+
+
+def test_split_by_day_gives_empty_slices_to_days_without_clicks() -> None:
+    first, second = date(2024, 3, 1), date(2024, 3, 2)
+    daily = pd.concat([_daily([(1, 2, [], [], [])], first), _daily([(2, 3, [], [], [])], second)])
+
+    slices = split_by_day(daily, [first, date(2024, 3, 5)])
+
+    assert list(slices) == [first, date(2024, 3, 5)]
+    assert slices[first]["banner_id"].tolist() == [1]
+    assert slices[date(2024, 3, 5)].empty
+    assert list(slices[date(2024, 3, 5)].columns) == DAILY_COLUMNS
+    assert split_by_day(daily.iloc[0:0], [first])[first].empty
+
+
+def test_merge_slices_counts_distinct_ids_across_days() -> None:
+    daily = pd.concat(
+        [
+            _daily([(1, 5, [10, 11], [10], ["1:1"]), (2, 1, [12], [12], ["1:1"])], date(2024, 3, 1)),
+            # Та же регистрация 11 через день — считается один раз
+            _daily([(1, 2, [11, 13], [11, 13], ["2:1", "1:1"])], date(2024, 3, 2)),
+        ]
+    )
+
+    per_banner, totals = merge_slices(daily)
+
+    assert per_banner.sort_values("banner_id").to_dict("records") == [
+        {"banner_id": 1, "clicks": 7, "regs": 3, "active": 2},
+        {"banner_id": 2, "clicks": 1, "regs": 1, "active": 1},
+    ]
+    # Итог активных — по регистрациям, как в get_all_q, а не по парам пользователь-курс
+    assert totals == {"clicks": 8, "regs": 4, "active": 4}
+    assert merge_slices(daily.iloc[0:0])[1] == {"clicks": 0, "regs": 0, "active": 0}
+
+
+def test_refresh_activations_replaces_active_sets_of_known_registrations() -> None:
+    daily = _daily([(1, 5, [10, 11], [10], ["1:1"]), (2, 3, [12], [], [])])
+    activations = pd.DataFrame(
+        [(11, "2:1"), (12, "3:2"), (12, "3:3"), (99, "9:9")],
+        columns=["reg_id", "active_key"],
+    )
+
+    refreshed = refresh_activations(daily, activations)
+
+    # Активация 10 пропала, 11 и 12 появились; чужая регистрация 99 в срез не попадает
+    assert refreshed["active_reg_ids"].tolist() == [[11], [12]]
+    assert [sorted(keys) for keys in refreshed["active_keys"]] == [["2:1"], ["3:2", "3:3"]]
+    assert daily["active_reg_ids"].tolist() == [[10], []]
+
+
+def test_live_slice_expires_after_max_age_despite_deltas() -> None:
+    cache = LiveSliceCache(ttl_seconds=0, max_age_seconds=0.2)
+    cache.put(KEY, datetime(2024, 3, 8, 12), _daily([]))
+    computed_at = cache.get(KEY).computed_at  # type: ignore[union-attr]
+
+    time.sleep(0.1)
+    cache.put(KEY, datetime(2024, 3, 8, 13), _daily([]), computed_at)
+    item = cache.get(KEY)
+    assert item is not None
+    assert item.computed_at == computed_at
+    assert not cache.is_fresh(item)
+
+    time.sleep(0.15)
+    assert cache.get(KEY) is None
+
+
+def test_load_daily_slices_takes_cache_then_rollup_then_raw_tables(committed_report_db: Any) -> None:
+    repo = ReportBannerLinksMediaRepo()
+    runner = ParallelQueryRunner(committed_report_db)  # type: ignore[arg-type]
+    days = [FIRST_DAY + timedelta(days=i) for i in range((LAST_DAY - FIRST_DAY).days + 1)]
+    expected = split_by_day(runner.run_one(repo.get_daily_q(REPORT_RANGE)), days)
+
+    rollup_days = days[2:4]
+    with committed_report_db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            for q in repo.get_refresh_daily_q(rollup_days[0], rollup_days[-1], REPORT_RANGE):
+                cursor.execute(q, [])
+            # Метка в агрегате показывает, что день взят из него, а не посчитан заново
+            cursor.execute(
+                "update analytics.banner_links_media_daily set clicks = clicks + 1000 where day = %s", (days[2],)
+            )
+        conn.commit()
+    cache = DaySliceCache()
+    cache.put_many({days[0]: expected[days[0]].assign(clicks=-1)})
+
+    slices, live = load_daily_slices(runner, repo, FIRST_DAY, LAST_DAY, ["select 1 as n"], partitions=3, cache=cache)
+
+    assert [frame["n"].tolist() for frame in live] == [[1]]
+    assert slices[0]["clicks"].tolist() == [-1] * len(expected[days[0]])
+    assert _normalized(slices[2].assign(clicks=slices[2]["clicks"] - 1000)) == _normalized(expected[days[2]])
+    for day, frame in list(zip(days, slices))[1:]:
+        if day != days[2]:
+            assert _normalized(frame) == _normalized(expected[day]), day
+    # Все дни теперь в кэше: повторная сборка не ходит ни в агрегат, ни в сырые таблицы
+    assert set(cache.get_many(days)) == set(days)
@@ -0,0 +1,44 @@
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any, Final
+
+import pytest
+
+MIGRATIONS_DIR: Final = Path(__file__).parents[3] / "sql" / "banner_links_media"
+
+# Таблица задач в том виде, в каком её дополняют миграции из sql/banner_links_media
+JOBS_DDL: Final = """
+create schema analytics;
+
+create table analytics.banner_links_media_jobs (
+    ticket text primary key,
+    register_id bigint not null,
+    status text not null,
+    rows_done int not null,
+    rows_total int not null,
+    result jsonb,
+    error jsonb,
+    time_created timestamp not null,
+    time_updated timestamp not null
+);
+"""
+
+
+@pytest.fixture
+def jobs_db(db_session: Any) -> Iterator[Any]:
+    """Схема analytics с таблицей задач; удаляется после теста.
+
+    Репозиторий коммитит каждую запись на своём соединении, поэтому откатить транзакцию, как в report_schema, нельзя.
+    """
+    migrations = [path.read_text() for path in sorted(MIGRATIONS_DIR.glob("*.sql"))]
+    with db_session.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(JOBS_DDL + "\n".join(migrations))
+        conn.commit()
+    try:
+        yield db_session
+    finally:
+        with db_session.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("drop schema analytics cascade")
+            conn.commit()
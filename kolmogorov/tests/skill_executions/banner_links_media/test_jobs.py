@@ -0,0 +1,54 @@
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from lib.skill_executions.banner_links_media.repo import BannerLinksMediaJobs
+from lib.skill_executions.banner_links_media.types import JobStatus
+
+CONTENT_HASH = "same-file"
+
+
+def _running_tickets(db_session: Any) -> list[str]:
+    with db_session.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("select ticket from analytics.banner_links_media_jobs where status = 'running'")
+            return [row[0] for row in cursor.fetchall()]
+
+
+def test_concurrent_requests_for_same_file_share_one_job(jobs_db: Any) -> None:
+    jobs = BannerLinksMediaJobs(jobs_db)
+    requests = 8
+    start = threading.Barrier(requests)
+
+    def create(register_id: int) -> str:
+        start.wait()
+        return jobs.create(str(uuid.uuid4()), register_id, rows_total=10, content_hash=CONTENT_HASH)
+
+    with ThreadPoolExecutor(max_workers=requests) as executor:
+        tickets = list(executor.map(create, range(requests)))
+
+    assert len(set(tickets)) == 1
+    assert _running_tickets(jobs_db) == tickets[:1]
+    assert jobs.find_running(CONTENT_HASH) == tickets[0]
+
+
+def test_finished_job_does_not_block_same_file(jobs_db: Any) -> None:
+    jobs = BannerLinksMediaJobs(jobs_db)
+    first = jobs.create("first", 1, rows_total=10, content_hash=CONTENT_HASH)
+    other = jobs.create("other", 2, rows_total=10, content_hash="other-file")
+
+    jobs.finish(first, JobStatus.SUCCEED, result=[])
+    second = jobs.create("second", 3, rows_total=10, content_hash=CONTENT_HASH)
+
+    assert (first, other, second) == ("first", "other", "second")
+    assert jobs.find_running(CONTENT_HASH) == "second"
+
+
+def test_stale_job_does_not_block_same_file(jobs_db: Any) -> None:
+    jobs = BannerLinksMediaJobs(jobs_db)
+    jobs.create("lost", 1, rows_total=10, content_hash=CONTENT_HASH)
+
+    assert jobs.fail_stale("lost", stale_after_seconds=0, error={"error_code": "JOB_INTERRUPTED"}) == 1
+    assert jobs.find_running(CONTENT_HASH) is None
+    assert jobs.create("retry", 2, rows_total=10, content_hash=CONTENT_HASH) == "retry"
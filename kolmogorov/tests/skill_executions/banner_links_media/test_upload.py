@@ -0,0 +1,34 @@
+import gzip
+import io
+
+import pytest
+
+from lib.skill_executions.banner_links_media.upload import is_gzip_upload, read_upload
+
+CSV = "Ссылка,Канал\nhttps://sirius.online,ВК\n".encode()
+
+
+@pytest.mark.parametrize(
+    ("payload", "content_type", "expected"),
+    [
+        (gzip.compress(CSV), "application/octet-stream", True),
+        (gzip.compress(CSV), None, True),
+        (CSV, "application/gzip", True),
+        (CSV, "text/csv", False),
+    ],
+)
+def test_is_gzip_upload_checks_magic_bytes_and_part_content_type(
+    payload: bytes, content_type: str | None, expected: bool
+) -> None:
+    stream = io.BytesIO(payload)
+
+    assert is_gzip_upload(stream, content_type) is expected
+    assert stream.tell() == 0
+
+
+def test_read_upload_reads_gzip_detected_by_magic_bytes() -> None:
+    stream = io.BytesIO(gzip.compress(CSV))
+
+    df = read_upload(stream, gzipped=is_gzip_upload(stream, "text/csv"))
+
+    assert df.to_dict(orient="records") == [{"link": "https://sirius.online", "channel": "ВК"}]
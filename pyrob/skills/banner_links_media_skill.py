@@ -1,6 +1,8 @@
-import json
+import gzip
 import logging
 import os
+import time
+from typing import Any
 
 import pandas as pd
 import requests
@@ -27,6 +29,25 @@ COLUMN_RENAMES = {
 REVERSE_RENAMES = {v: k for k, v in COLUMN_RENAMES.items()}
 REVERSE_RENAMES["banner_link"] = "Баннерная ссылка"
 
+MAX_REPORTED_ISSUES = 20
+JOB_POLL_INTERVAL_SECONDS = 3
+JOB_WAIT_SECONDS = 15 * 60
+# Сбои генерации временные: повтор с resume_id продолжает запрос с первой незаконченной строки
+GENERATION_ATTEMPTS = 3
+RETRYABLE_ERRORS = {"BANNER_GENERATION", "SHORT_URL_GENERATION_FAILED", "DB_UPDATE_FAILED"}
+
+
+def _format_details(details: list[dict[str, Any]] | None) -> str:
+    if not details:
+        return ""
+    lines = [
+        f"Строка {issue['row']}, «{REVERSE_RENAMES.get(issue['column'], issue['column'])}»: {issue['value']}"
+        for issue in details[:MAX_REPORTED_ISSUES]
+    ]
+    if len(details) > MAX_REPORTED_ISSUES:
+        lines.append(f"…и ещё {len(details) - MAX_REPORTED_ISSUES}")
+    return "\n\nПроблемные значения:\n" + "\n".join(lines)
+
 
 class BannerLinksMediaSkill(AbstractSkill):
     name = "Баннерные ссылки для соцсетей"
@@ -37,31 +58,25 @@ class BannerLinksMediaSkill(AbstractSkill):
 
     def run(self) -> SkillResult:
         file = self.parameters["file"].to_str()
-        df = pd.read_csv(file)
-        df.rename(columns=COLUMN_RENAMES, inplace=True)
-        params = {"file": json.dumps(df.to_dict(orient="records"), ensure_ascii=False)}
+        with open(file, "rb") as f:
+            body = gzip.compress(f.read())
 
         host = os.getenv("KOLMOGOROV_HOST")
         port = os.getenv("KOLMOGOROV_PORT")
+        base_url = f"http://{host}:{port}"
 
-        r = requests.post(
-            f"http://{host}:{port}/bannerLinksMedia",
-            params=params,
-            timeout=60,
-        )
-
-        try:
-            r_json = r.json()
-        except Exception:
-            raise SkillExecutionError(
-                pretty_reason="Не получилось сгенерировать баннерные ссылки. Попробуй позднее, пожалуйста.",
-                tech_reason="Invalid JSON response from banner links service.",
-            )
+        resume_id = None
+        for attempt in range(1, GENERATION_ATTEMPTS + 1):
+            status_code, r_json = self._generate(base_url, body, resume_id)
+            resume_id = r_json.get("register_id")
+            if r_json.get("error_code") not in RETRYABLE_ERRORS or resume_id is None:
+                break
+            logger.warning("Banner links generation failed, attempt=%s, register_id=%s", attempt, resume_id)
 
         error_code = r_json.get("error_code")
         client_msg = r_json.get("error")
 
-        if r.status_code == 200:
+        if status_code == 200:
             df = pd.DataFrame(r_json["file"])
             df = df.rename(columns=REVERSE_RENAMES)
             fname = os.path.join(os.sep, "tmp", "banner_links.csv")
@@ -70,19 +85,22 @@ class BannerLinksMediaSkill(AbstractSkill):
         elif error_code == "UNKNOWN_CHANNEL":
             raise SkillExecutionError(
                 pretty_reason="Не могу сгенерировать ссылки. Каналы в таблице не совпадают с теми, которые я знаю.\n"
-                "Исправь их и попробуй еще раз!",
+                "Исправь их и попробуй еще раз!"
+                + _format_details(r_json.get("details")),
                 tech_reason=f"Banner links request error. Reason={client_msg}",
             )
         elif error_code == "UNKNOWN_PARTNER":
             raise SkillExecutionError(
                 pretty_reason="Не могу сгенерировать ссылки. Партнёры в таблице не совпадают с теми, которые я знаю.\n"
-                "Исправь их и попробуй еще раз!",
+                "Исправь их и попробуй еще раз!"
+                + _format_details(r_json.get("details")),
                 tech_reason=f"Banner links request error. Reason={client_msg}",
             )
         elif error_code == "UNKNOWN_LINK_TYPE":
             raise SkillExecutionError(
                 pretty_reason="Не могу сгенерировать ссылки. Типы публикации в таблице не совпадают с теми, "
-                "которые я знаю.\nИсправь их и попробуй еще раз!",
+                "которые я знаю.\nИсправь их и попробуй еще раз!"
+                + _format_details(r_json.get("details")),
                 tech_reason=f"Banner links request error. Reason={client_msg}",
             )
         elif error_code == "CANT_PARSE_FILE":
@@ -98,9 +116,57 @@ class BannerLinksMediaSkill(AbstractSkill):
         else:
             raise SkillExecutionError(
                 pretty_reason="Не получилось сгенерировать баннерные ссылки. Попробуй позже.",
-                tech_reason=f"Unexpected error. Status={r.status_code}, Reason={client_msg}",
+                tech_reason=f"Unexpected error. Status={status_code}, Reason={client_msg}",
+            )
+
+    @classmethod
+    def _generate(cls, base_url: str, body: bytes, resume_id: int | None) -> tuple[int, dict[str, Any]]:
+        params: dict[str, Any] = {"async_mode": "true"}
+        if resume_id is not None:
+            params["resume_id"] = resume_id
+
+        r = requests.post(
+            f"{base_url}/bannerLinksMedia/upload",
+            files={"file": ("banner_links.csv.gz", body, "application/gzip")},
+            params=params,
+            timeout=60,
+        )
+
+        try:
+            r_json = r.json()
+        except Exception:
+            raise SkillExecutionError(
+                pretty_reason="Не получилось сгенерировать баннерные ссылки. Попробуй позднее, пожалуйста.",
+                tech_reason="Invalid JSON response from banner links service.",
             )
 
+        status_code = r.status_code
+        if status_code == 202:
+            r_json = cls._wait_for_job(base_url, r_json["ticket"])
+            status_code = 200 if r_json.get("status") == "succeed" else 500
+        return status_code, r_json
+
+    @staticmethod
+    def _wait_for_job(base_url: str, ticket: str) -> dict[str, Any]:
+        deadline = time.monotonic() + JOB_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(JOB_POLL_INTERVAL_SECONDS)
+            try:
+                r = requests.get(f"{base_url}/bannerLinksMedia/result_{ticket}", timeout=10)
+                r.raise_for_status()
+                job = r.json()
+            except Exception as e:
+                logger.warning("Can't get banner links job status, ticket=%s: %s", ticket, e)
+                continue
+            if job["status"] != "running":
+                return job
+            logger.debug("Banner links job %s: %s/%s rows", ticket, job["rows_done"], job["rows_total"])
+
+        raise SkillExecutionError(
+            pretty_reason="Генерация баннерных ссылок занимает слишком много времени. Попробуй позже.",
+            tech_reason=f"Banner links job timed out, ticket={ticket}",
+        )
+
     @classmethod
     def get_manual(cls) -> str:
         return (
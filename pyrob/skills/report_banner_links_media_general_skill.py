@@ -22,6 +22,11 @@ class ReportBannerLinksMediaGeneralSkill(AbstractSkill):
         telegram_bot = RobTelegramContextProvider.get_context().telegram_bot
         buttons: list[list[RobInlineButton]] = [
             [RunSkillInlineButton(text="Построить новый отчёт", skill_cls_name="ReportBannerLinksMediaRequestSkill")],
+            [
+                RunSkillInlineButton(
+                    text="Построить новый отчёт в xlsx", skill_cls_name="ReportBannerLinksMediaXlsxRequestSkill"
+                )
+            ],
             [RunSkillInlineButton(text="Забрать отчёт по номеру", skill_cls_name="ReportBannerLinksMediaGetSkill")],
             [SendMessageButton(text="Не будем строить отчёт", reply_text="Понял. Не будем строить отчёт.")],
         ]
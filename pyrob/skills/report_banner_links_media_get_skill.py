@@ -16,6 +16,7 @@ from pyrob.telegram_bot.model.skill import (
 from pyrob.telegram_bot.skill.matcher import RobPrefixMatcher
 from pyrob.telegram_bot.skill.permissions import role_oneof_permission
 from pyrob.telegram_bot.skill.skill import AbstractSkill
+from pyrob.telegram_bot.skill.skills.report_banner_links_media_request_skill import _get_extension
 from pyrob.telegram_bot.skill.skills.report_course_difficulty_get_skill import TaskStatus, _get_message, uuid_parameter
 from pyrob.telegram_bot.telegram_context import RobTelegramContextProvider
 
@@ -65,7 +66,7 @@ class ReportBannerLinksMediaGetSkill(AbstractSkill):
                     fname.write(response.content)
                     return FileResult(
                         file_path=fname.name,
-                        custom_name="report_banner.csv",
+                        custom_name=f"report_banner{_get_extension(report_url)}",
                         is_tmp_file=True,
                         caption=_get_message(status),
                     )
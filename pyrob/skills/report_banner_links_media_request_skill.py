@@ -1,6 +1,7 @@
 import json
 import os
 import tempfile
+from urllib.parse import urlparse
 
 import requests
 import structlog
@@ -19,6 +20,11 @@ from pyrob.telegram_bot.skill.skill import AbstractSkill
 logger = structlog.getLogger(__name__)
 
 
+def _get_extension(report_url: str) -> str:
+    # Отчёт может быть в csv, parquet или xlsx — имя файла берём из ссылки
+    return os.path.splitext(urlparse(report_url).path)[1] or ".csv"
+
+
 class ReportBannerLinksMediaRequestSkill(AbstractSkill):
     name = "Запустить построение отчёта по баннерным ссылкам"
     description = "Запускаю построение отчёта по баннерным ссылкам"
@@ -36,6 +42,8 @@ class ReportBannerLinksMediaRequestSkill(AbstractSkill):
             date_format="%d.%m.%Y",
         ),
     ]
+    # Формат файла отчёта: csv, parquet или xlsx
+    output_format = "csv"
 
     def run(self) -> SkillResult:
         host = os.getenv("KOLMOGOROV_HOST")
@@ -46,6 +54,7 @@ class ReportBannerLinksMediaRequestSkill(AbstractSkill):
                 "parameters": {
                     "from_date": str(self.parameters["from_date"].value),
                     "to_date": str(self.parameters["to_date"].value),
+                    "output_format": self.output_format,
                 },
             }
         )
@@ -77,7 +86,7 @@ class ReportBannerLinksMediaRequestSkill(AbstractSkill):
                     fname.write(response.content)
                     return FileResult(
                         file_path=fname.name,
-                        custom_name="report_banner.csv",
+                        custom_name=f"report_banner{_get_extension(report_url)}",
                         is_tmp_file=True,
                         caption="В базе уже есть такой отчёт.",
                     )
@@ -101,3 +110,10 @@ class ReportBannerLinksMediaRequestSkill(AbstractSkill):
     @classmethod
     def is_short_form(cls, message: str) -> bool:
         return True
+
+
+class ReportBannerLinksMediaXlsxRequestSkill(ReportBannerLinksMediaRequestSkill):
+    name = "Запустить построение xlsx-отчёта по баннерным ссылкам"
+    description = "Запускаю построение отчёта по баннерным ссылкам в формате xlsx"
+    matchers_info = [RobPrefixMatcher("запустить построение xlsx-отчёта по баннерным ссылкам")]
+    output_format = "xlsx"